@@ -16,6 +16,7 @@ const Mix = () => {
   const [duration, setDuration] = useState(0);
   const [data, setData] = useState(null);
   const [volume, setVolume] = useState(1.0);
+  const [sessionId, setSessionId] = useState(null);
 
   const audioRef = useRef(null);
 
@@ -86,12 +87,13 @@ const Mix = () => {
       .then((response) => response.json())
       .then((data) => {
         setData(data.message);
-        mix_songs();
+        setSessionId(data.session_id);
+        mix_songs(data.session_id);
       })
       .catch((error) => console.error("Upload error:", error));
   };
 
-  const mix_songs = () => {
+  const mix_songs = (session) => {
     let interval;
     setProgress(0);
   
@@ -102,7 +104,7 @@ const Mix = () => {
       });
     }, 500);
   
-    fetch("http://127.0.0.1:5000/api/mix_songs")
+    fetch(`http://127.0.0.1:5000/api/mix_songs?stream=1&session=${session}`)
       .then((response) => response.blob())
       .then(async (blob) => {
         clearInterval(interval);
@@ -134,6 +136,7 @@ const Mix = () => {
     const formData = new FormData();
     formData.append("file1", song1);
     formData.append("file2", song2);
+    formData.append("session_id", sessionId);
     fetch("http://127.0.0.1:5000/api/save_to_db", {
       method: "POST",
       body: formData,
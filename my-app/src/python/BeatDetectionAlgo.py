@@ -1,117 +1,206 @@
 import librosa
 import numpy as np
-from sklearn.cluster import KMeans
+import scipy.ndimage
+from sklearn.cluster import MiniBatchKMeans
 from scipy.signal import find_peaks
+from decode import as_track
 
-def detect_section_transitions(audio_file, n_sections=3):
+SECTION_SR = 22050
+SECTION_N_FFT = 2048
+SECTION_HOP = 1024  # Smaller window for better temporal resolution
+SECTION_BLOCK_FRAMES = 1024  # STFT frames per block, ~48s at 22.05 kHz
+SECTION_SEGMENT_SECONDS = 1.0  # clustering resolution when no beats are given
+CENS_SMOOTHING = 41
+
+def stft_blocks(y, n_fft=SECTION_N_FFT, hop_length=SECTION_HOP, block_frames=SECTION_BLOCK_FRAMES):
+    """
+    Magnitude spectrogram of y, yielded block_frames frames at a time. The
+    frames are the ones librosa.stft(center=True) would produce, but only
+    one block's worth of spectrogram is ever in memory.
+    """
+    pad = n_fft // 2
+    n_frames = 1 + len(y) // hop_length
+    for f0 in range(0, n_frames, block_frames):
+        f1 = min(n_frames, f0 + block_frames)
+        # Sample span of frames f0..f1-1 on the zero-padded (centered) signal
+        start = f0 * hop_length - pad
+        stop = (f1 - 1) * hop_length - pad + n_fft
+        segment = y[max(0, start):min(len(y), stop)]
+        if start < 0 or stop > len(y):
+            segment = np.pad(segment, (max(0, -start), max(0, stop - len(y))))
+        yield np.abs(librosa.stft(segment, n_fft=n_fft, hop_length=hop_length, center=False))
+
+class SectionFeatures:
+    """
+    Accumulates per-frame section features from magnitude spectrogram blocks:
+    spectral contrast, L1-normalized chroma, RMS, mean mel level and onset
+    strength, all derived from the same STFT. Filter banks are built once.
+    """
+    def __init__(self, sr, n_fft=SECTION_N_FFT, n_mels=128):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+        self.chroma_basis = librosa.filters.chroma(sr=sr, n_fft=n_fft)
+        self.blocks = {"contrast": [], "chroma": [], "rms": [], "mel": [], "onset": []}
+        self._last_mel_db = None
+
+    def add(self, S):
+        power = S ** 2
+        mel_db = librosa.power_to_db(self.mel_basis @ power, top_db=None)
+
+        # Onset strength: mean positive change in mel level since the previous
+        # frame, carried across block boundaries
+        previous = self._last_mel_db if self._last_mel_db is not None else mel_db[:, :1]
+        onset = np.maximum(0, np.diff(np.hstack([previous, mel_db]), axis=1)).mean(axis=0)
+        self._last_mel_db = mel_db[:, -1:]
+
+        chroma = self.chroma_basis @ power
+        chroma /= np.maximum(chroma.sum(axis=0, keepdims=True), 1e-10)
+
+        self.blocks["contrast"].append(librosa.feature.spectral_contrast(S=S, sr=self.sr, n_fft=self.n_fft))
+        self.blocks["chroma"].append(chroma)
+        self.blocks["rms"].append(librosa.feature.rms(S=S, frame_length=self.n_fft)[0])
+        self.blocks["mel"].append(mel_db.mean(axis=0))
+        self.blocks["onset"].append(onset)
+
+    def result(self):
+        """Features as full-length arrays; chroma as CENS (quantized, smoothed, L2-normalized)."""
+        features = {name: np.concatenate(blocks, axis=-1) for name, blocks in self.blocks.items()}
+        features["chroma"] = _cens(features["chroma"])
+        return features
+
+def section_features(S, sr, n_fft=SECTION_N_FFT, block_frames=SECTION_BLOCK_FRAMES):
+    """SectionFeatures for a magnitude spectrogram that is already in memory, e.g. extract_features'."""
+    features = SectionFeatures(sr, n_fft)
+    for f0 in range(0, S.shape[1], block_frames):
+        features.add(S[:, f0:f0 + block_frames])
+    return features.result()
+
+def _cens(chroma, win_len_smooth=CENS_SMOOTHING):
+    # Same steps as librosa.feature.chroma_cens, applied to STFT chroma
+    quantized = np.zeros_like(chroma)
+    for threshold in (0.4, 0.2, 0.1, 0.05):
+        quantized += chroma > threshold
+    window = librosa.filters.get_window("hann", win_len_smooth + 2, fftbins=False)
+    window /= window.sum()
+    smoothed = scipy.ndimage.convolve1d(quantized, window[1:-1], axis=1, mode="constant")
+    return librosa.util.normalize(smoothed, norm=2, axis=0)
+
+def _cluster_labels(features, n_clusters, boundaries):
+    """
+    Cluster labels per frame, from MiniBatchKMeans over features averaged
+    between boundaries (beat frames, or fixed-length segments).
+    """
+    n_frames = features.shape[0]
+    boundaries = librosa.util.fix_frames(boundaries, x_min=0, x_max=n_frames)
+    segments = librosa.util.sync(features.T, boundaries, aggregate=np.mean).T
+    kmeans = MiniBatchKMeans(n_clusters=min(n_clusters, len(segments)), random_state=42, n_init=3, batch_size=256)
+    segment_labels = kmeans.fit_predict(segments)
+    segment_of_frame = np.searchsorted(boundaries, np.arange(n_frames), side="right") - 1
+    return segment_labels[np.minimum(segment_of_frame, len(segment_labels) - 1)]
+
+def detect_section_transitions(source, n_sections=3, beats=None, sr=SECTION_SR, hop_length=SECTION_HOP,
+                               block_frames=SECTION_BLOCK_FRAMES):
     """
     Enhanced verse/chorus transition detection focusing on:
     - Spectral contrast (important for verse-chorus transitions)
     - Harmonic changes
     - Energy level changes
     - Rhythmic pattern changes
+    source is a path or DecodedTrack; the whole song is analyzed. Every
+    feature comes from one STFT computed block by block, and clustering
+    runs on beat-synchronous averages when beats (seconds) are given.
+    """
+    y = as_track(source).mono(sr)
+
+    features = SectionFeatures(sr)
+    for S in stft_blocks(y, SECTION_N_FFT, hop_length, block_frames):
+        features.add(S)
+    return section_transitions(features.result(), sr, hop_length, n_sections, beats)
+
+def section_transitions(f, sr, hop_length, n_sections=3, beats=None):
+    """
+    Most likely section transitions (seconds) from SectionFeatures.result()
+    at the given rate and hop: up to three, at least 15s apart, after 50s.
     """
-    # Load audio with optimal parameters
-    y, sr = librosa.load(audio_file, duration=180)  # Analyze first 3 minutes
-    hop_length = 1024  # Smaller window for better temporal resolution
-    
-    # Extract more targeted features
-    # Spectral contrast (helps identify changes in musical texture)
-    contrast = librosa.feature.spectral_contrast(y=y, sr=sr, hop_length=hop_length)
-    
-    # Harmonic content with better temporal resolution
-    chroma = librosa.feature.chroma_cens(y=y, sr=sr, hop_length=hop_length)
-    
-    # Energy features
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-    # Mel-scaled spectrogram for better frequency resolution
-    mel_spec = librosa.feature.melspectrogram(y=y, sr=sr, hop_length=hop_length, n_mels=128)
-    mel_db = librosa.power_to_db(mel_spec, ref=np.max)
-    
-    # Rhythm features
-    tempo, beats = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
-    beat_strength = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
-    
+    contrast, chroma, rms, mel_level, beat_strength = f["contrast"], f["chroma"], f["rms"], f["mel"], f["onset"]
+
     # Normalize and combine features
-    features = np.vstack([
-        contrast,  # Spectral contrast features
-        chroma,    # Harmonic content
-        rms[np.newaxis, :contrast.shape[1]],  # Energy
-        np.mean(mel_db, axis=0)[np.newaxis, :contrast.shape[1]],  # Average mel energy
-        beat_strength[np.newaxis, :contrast.shape[1]]  # Rhythmic information
+    combined = np.vstack([
+        contrast,                  # Spectral contrast features
+        chroma,                    # Harmonic content
+        rms[np.newaxis, :],        # Energy
+        mel_level[np.newaxis, :],  # Average mel energy
+        beat_strength[np.newaxis, :]  # Rhythmic information
     ]).T
-    
-    # Normalize features
-    features = (features - np.mean(features, axis=0)) / np.std(features, axis=0)
-    
+    spread = np.std(combined, axis=0)
+    combined = (combined - np.mean(combined, axis=0)) / np.where(spread > 0, spread, 1)
+
     # Cluster sections with more clusters for finer granularity
-    kmeans = KMeans(n_clusters=n_sections + 2, random_state=42)
-    labels = kmeans.fit_predict(features)
-    
+    if beats is not None and len(beats) > n_sections + 2:
+        boundaries = librosa.time_to_frames(beats, sr=sr, hop_length=hop_length)
+    else:
+        boundaries = np.arange(0, len(combined), max(1, int(SECTION_SEGMENT_SECONDS * sr / hop_length)))
+    labels = _cluster_labels(combined, n_sections + 2, boundaries)
+
     # Calculate transition scores with adjusted weights
     window_time = hop_length / sr
-    
-    # Fix the shape mismatch in the transition scores calculation
+
     label_changes = np.abs(np.diff(labels, prepend=labels[0]))
-    contrast_changes = np.mean(np.abs(np.diff(contrast, axis=1)), axis=0)
+    contrast_changes = np.mean(np.abs(np.diff(contrast, axis=1, prepend=contrast[:, :1])), axis=0)
     rms_changes = np.abs(np.diff(rms, prepend=rms[0]))
-    chroma_changes = np.mean(np.abs(np.diff(chroma, axis=1)), axis=0)
-    
-    # Ensure all arrays have the same length
-    min_length = min(len(label_changes), len(contrast_changes), 
-                    len(rms_changes), len(chroma_changes), 
-                    len(beat_strength))
-    
-    # Enhanced scoring system with proper array lengths:
+    chroma_changes = np.mean(np.abs(np.diff(chroma, axis=1, prepend=chroma[:, :1])), axis=0)
+
+    # Enhanced scoring system:
     transition_scores = (
-        0.35 * label_changes[:min_length] +      # Structure changes
-        0.25 * contrast_changes[:min_length] +   # Texture changes
-        0.20 * rms_changes[:min_length] +        # Energy changes
-        0.10 * chroma_changes[:min_length] +     # Harmonic changes
-        0.10 * beat_strength[:min_length]        # Rhythmic intensity
+        0.35 * label_changes +      # Structure changes
+        0.25 * contrast_changes +   # Texture changes
+        0.20 * rms_changes +        # Energy changes
+        0.10 * chroma_changes +     # Harmonic changes
+        0.10 * beat_strength        # Rhythmic intensity
     )
-    
+
     # Smooth the transition scores
     window_size = int(0.2 * sr / hop_length)  # 200ms window
-    transition_scores = np.convolve(transition_scores, 
-                                  np.hanning(window_size)/window_size, 
+    transition_scores = np.convolve(transition_scores,
+                                  np.hanning(window_size)/window_size,
                                   mode='same')
-    
+
     # Find peaks with adaptive threshold
-    threshold = np.percentile(transition_scores, 85) 
+    threshold = np.percentile(transition_scores, 85)
 
     # Minimum 15 seconds between transitions
-    min_distance = int(15/window_time)  
-    
+    min_distance = int(15/window_time)
+
     peaks, _ = find_peaks(
         transition_scores,
         height=threshold,
         distance=min_distance,
-        prominence=np.std(transition_scores) 
+        prominence=np.std(transition_scores)
     )
-    
+
     # Convert to timestamps
     transitions = sorted([p * window_time for p in peaks])
-    
+
     # Filter out transitions before 50 seconds
     transitions = [t for t in transitions if t >= 50]
-    
+
     # Post-processing for most significant transitions
     if len(transitions) > 0:
         # Get peak scores for filtered transitions
-        peak_scores = [transition_scores[int(t/window_time)] for t in transitions]
-        
+        peak_scores = [transition_scores[int(round(t/window_time))] for t in transitions]
+
         # Select top transitions based on score
         if len(transitions) > 3:
             top_indices = np.argsort(peak_scores)[-3:]
             transitions = sorted([transitions[i] for i in top_indices])
-    
+
     return transitions
 
 def print_transitions(audio_file):
     """Print detected transitions with timestamps"""
     transitions = detect_section_transitions(audio_file)
-    
+
     print(f"\nAnalysis of: {audio_file}")
     if not transitions:
         print("No clear transitions detected")
@@ -125,4 +214,3 @@ def print_transitions(audio_file):
 if __name__ == "__main__":
     audio_file = 'test_songs/CantStopTheFeeling.mp3'
     print_transitions(audio_file)
-    
\ No newline at end of file
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+import logging
+logging.basicConfig(level=logging.INFO)
+
+CACHE_ROOT = ".cache"
+
+def hash_audio(y, sr):
+    """
+    Content hash of decoded audio. Two uploads with the same audio share a key
+    no matter what they were named when saved.
+    """
+    h = hashlib.sha1()
+    h.update(str(int(sr)).encode())
+    h.update(np.ascontiguousarray(y).tobytes())
+    return h.hexdigest()
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Content hash of a file on disk, read in chunks."""
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class NpzCache:
+    """
+    Size-bounded on-disk cache of NumPy arrays, one .npz file per key.
+    Entries are written atomically (temp file + rename) so concurrent
+    readers never see a partial file. Least recently used entries are
+    evicted once the directory grows past max_bytes.
+    """
+    SUFFIX = ".npz"
+
+    def __init__(self, name, max_bytes=256 * 1024 * 1024, root=CACHE_ROOT):
+        self.directory = os.path.join(root, name)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            # Bump mtime so eviction treats this entry as recently used
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def put(self, key, /, **arrays):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -3,17 +3,36 @@ from pydub.effects import low_pass_filter, high_pass_filter
 import librosa
 import numpy as np
 from faster_whisper import WhisperModel
-import pickle
 import os
 import soundfile as sf
-from pydub.utils import get_array_type
-from array import array
 import threading
+from executor import run_in_process, run_with_shared_array
 import logging
+from audio_cache import NpzCache
+from decode import DecodedTrack, as_track
+from pcm_store import PcmStore, allocate_pcm, read_pcm
+from features import TrackAnalysis, extract_features, ANALYSIS_SR, N_FFT, HOP_LENGTH
 logging.basicConfig(level=logging.INFO)
 
 MIN_INTRO_DURATION = 30
 
+ANALYSIS_CACHE_VERSION = "v3"
+analysis_cache = NpzCache("analysis", max_bytes=int(os.getenv("ANALYSIS_CACHE_BYTES", 128 * 1024 * 1024)))
+
+# Stretched audio is kept as memory-mapped float32 PCM, so a hit is
+# neither decompressed nor copied
+STRETCH_CACHE_VERSION = "v2"
+stretch_cache = PcmStore("stretch", max_bytes=int(os.getenv("STRETCH_CACHE_BYTES", 1024 * 1024 * 1024)))
+STRETCH_RATE_STEP = 0.001
+
+STRETCH_PREROLL = 1.0       # s of context ahead of a stretched region
+STRETCH_RAMP_SECONDS = 8.0  # s to ease from the stretch rate back to 1.0
+STRETCH_RAMP_STEP = 0.25    # s per constant-rate step of the ramp
+STRETCH_SPLICE = 0.05       # s crossfade from the ramp into unstretched audio
+
+LYRICS_CACHE_VERSION = "v3"
+lyrics_cache = NpzCache("lyrics", max_bytes=int(os.getenv("LYRICS_CACHE_BYTES", 32 * 1024 * 1024)))
+
 #convert to wav
 def convert_to_wav(input_path, output_path):
     audio = AudioSegment.from_file(input_path)
@@ -24,42 +43,163 @@ def to_camelot(key_index):
     return camelot_wheel[key_index % 12]
 
 # Analyze Audio Features
-def analyze_audio(file_path):
-    y, sr = librosa.load(file_path, sr=None, mono=True)
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-    beats = librosa.frames_to_time(beat_frames, sr=sr)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    key = np.argmax(np.mean(chroma, axis=1))
-    energy = librosa.feature.rms(y=y)[0]
-    energy_times = librosa.frames_to_time(range(len(energy)), sr=sr)
-    return tempo, beats, y, sr, key, energy, energy_times
+def analyze_audio(source, sr=ANALYSIS_SR, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    TrackAnalysis of a track (path or DecodedTrack), from its mono mix at sr
+    (never above the track's own rate; 0 or None for that rate) with one
+    STFT of the given size. Times come back in seconds either way.
+    """
+    track = as_track(source)
+    sr = min(int(sr or track.sr), track.sr)
+
+    # Features depend only on the decoded samples, so a track we've seen
+    # before skips the STFT and beat tracking entirely
+    cache_key = f"{track.content_hash()}.{sr}.{n_fft}.{hop_length}.{ANALYSIS_CACHE_VERSION}"
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return TrackAnalysis.from_arrays(cached)
+
+    analysis = extract_features(track.mono(sr), sr, n_fft, hop_length)
+    analysis_cache.put(cache_key, **analysis.to_arrays())
+    return analysis
+
+def _analyze_shared(samples, sr, name, *args):
+    # Runs in a pool worker on a shared-memory view; only the compact
+    # TrackAnalysis is pickled back to the parent
+    return analyze_audio(DecodedTrack(samples, sr, name), *args)
+
+def _analyze_pcm(path, name, content_hash, *args):
+    # Runs in a pool worker that maps the track's PCM file itself; the
+    # parent's hash comes along so the worker doesn't read it all to rehash
+    samples, sr = read_pcm(path)
+    return analyze_audio(DecodedTrack(samples, sr, name, path, content_hash), *args)
+
+def analyze_tracks(tracks, sr=ANALYSIS_SR, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    analyze_audio for several DecodedTracks at once on the process pool.
+    Tracks mapped from a PCM file are opened by path in the worker; others
+    are copied into shared memory. Returns TrackAnalysis objects in input
+    order; worker errors are raised.
+    """
+    args = (sr, n_fft, hop_length)
+    futures = [
+        run_in_process(_analyze_pcm, track.path, track.name, track.content_hash(), *args)
+        if track.path is not None else
+        run_with_shared_array(_analyze_shared, track.samples, track.sr, track.name, *args)
+        for track in tracks
+    ]
+    results = []
+    for track, future in zip(tracks, futures):
+        try:
+            results.append(future.result())
+        except FileNotFoundError:
+            # Evicted from its store before the worker opened it; this
+            # process still maps the samples, so share those instead
+            results.append(run_with_shared_array(_analyze_shared, track.samples, track.sr, track.name, *args).result())
+    return results
 
 # Tempo Adjustment
-def create_tempo_adjusted_version(input_file, output_file, original_tempo, target_tempo):
+def get_stretch_rate(original_tempo, target_tempo):
+    rate = original_tempo / target_tempo
+    rate = np.clip(rate, 0.85, 1.15)  #clamp for quality
+    # Quantized so near-identical tempo pairs share a stretch cache entry;
+    # one step drifts by under 5ms over a 16-beat fade
+    return round(float(np.round(rate / STRETCH_RATE_STEP) * STRETCH_RATE_STEP), 6)
+
+def _time_stretch(y, sr, rate, using_rubberband, time_map=None):
+    if using_rubberband:
+        import pyrubberband as rubberband
+        if time_map is not None:
+            return rubberband.timemap_stretch(y, sr, time_map)
+        return rubberband.time_stretch(y, sr, rate,)
+    return librosa.effects.time_stretch(y, rate=rate)
+
+def _ramp_time_map(hold_in, ramp_in, tail_in, rate, sr):
+    """
+    Rubber Band time map (input frame, output frame) pairs: rate for the
+    first hold_in frames, then easing to 1.0 in short constant-rate steps
+    over ramp_in frames, then tail_in frames at 1.0.
+    """
+    steps = max(1, int(ramp_in / (STRETCH_RAMP_STEP * sr)))
+    time_map = [(0, 0), (hold_in, int(round(hold_in / rate)))]
+    position, output = float(hold_in), hold_in / rate
+    for k in range(steps):
+        step_rate = rate + (1.0 - rate) * (k + 0.5) / steps
+        position += ramp_in / steps
+        output += (ramp_in / steps) / step_rate
+        time_map.append((int(round(position)), int(round(output))))
+    time_map.append((hold_in + ramp_in + tail_in, int(round(output)) + tail_in))
+    return time_map
+
+def stretch_track(track, rate, start=0.0, end=None, hold=None, ramp=None):
+    """
+    Time-stretches a DecodedTrack (mono) by a constant rate, from start to
+    end seconds of the original (the whole track by default). The result
+    begins exactly at start: STRETCH_PREROLL seconds ahead of it are fed to
+    the stretcher as context and trimmed off.
+
+    With hold (seconds of output) only that much is stretched at rate; the
+    next `ramp` seconds ease back to the original tempo and the rest of the
+    track follows unstretched. Needs Rubber Band; librosa stretches it all.
+
+    Results are cached by content hash, rate, region and engine, so matching
+    the same track to the same tempo again skips the stretch.
+    """
     try:
         import pyrubberband as rubberband
         using_rubberband = True
     except ImportError:
         using_rubberband = False
 
-    y, sr = librosa.load(input_file, sr=None)
-    rate = original_tempo / target_tempo
-    rate = np.clip(rate, 0.85, 1.15)  #clamp for quality
-
-    print(f"\n=== Time Stretching ===")
-    print(f"Original Tempo: {original_tempo:.2f} BPM")
-    print(f"Target Tempo:   {target_tempo:.2f} BPM")
-    print(f"Stretch Rate:   {rate:.3f}")
+    sr = track.sr
+    first = int(round(start * sr))
+    last = track.frames if end is None else min(track.frames, int(round(end * sr)))
+    context = min(first, int(STRETCH_PREROLL * sr))
+    name = f"{track.name} (x{rate:.3f})"
+
+    ramped = hold is not None and using_rubberband
+    if ramped:
+        ramp = STRETCH_RAMP_SECONDS if ramp is None else ramp
+        hold_in = int(hold * rate * sr)
+        ramp_in = int(ramp * sr)
+        splice = int(STRETCH_SPLICE * sr)
+        if first + hold_in + ramp_in + splice >= last:
+            ramped = False
+
+    engine = "rubberband" if using_rubberband else "librosa"
+    region = f"{first}-{last}" + (f".h{hold_in}.r{ramp_in}" if ramped else "")
+    cache_key = f"{track.content_hash()}.r{rate:.4f}.{engine}.{region}.{STRETCH_CACHE_VERSION}"
+    cached = stretch_cache.get(cache_key)
+    stats = stretch_cache.stats()
+    if cached is not None:
+        logging.info(f"Stretch cache hit for {track.name} at x{rate:.3f} (hit rate {stats['hit_rate']:.0%})")
+        return DecodedTrack(cached[0], sr, name)
+
+    y = track.mono()
     
     if using_rubberband:
         print("Using Rubber Band for high-quality stretching")
-        y_stretched = rubberband.time_stretch(y, sr, rate,)
     else:
         print("Rubber Band not found. Falling back to Librosa (lower quality)")
-        y_stretched = librosa.effects.time_stretch(y, rate)
 
-    sf.write(output_file, y_stretched, sr)
-    print(f"Tempo-adjusted audio saved to: {output_file}")
+    if ramped:
+        # Stretched through the ramp plus a short splice at rate 1.0, which is
+        # crossfaded into the untouched remainder
+        ramp_end = first + hold_in + ramp_in
+        time_map = _ramp_time_map(context + hold_in, ramp_in, splice, rate, sr)
+        y_stretched = _time_stretch(y[first - context:ramp_end + splice], sr, rate, True, time_map)
+        fade_in = np.linspace(0, 1, splice, dtype=np.float32)
+        y_stretched[-splice:] = y_stretched[-splice:] * (1 - fade_in) + y[ramp_end:ramp_end + splice] * fade_in
+        y_stretched = np.concatenate([y_stretched, y[ramp_end + splice:last]])
+    else:
+        y_stretched = _time_stretch(y[first - context:last], sr, rate, using_rubberband)
+    y_stretched = y_stretched[int(round(context / rate)):]
+
+    # Returned mapped from the store, so the stretched copy isn't kept in RAM
+    samples, _ = stretch_cache.put(cache_key, y_stretched, sr)
+    return DecodedTrack(samples, sr, name)
+
+FADE_CURVES = ("ease_in_out", "linear", "log")
 
 def custom_fade_curve(length, direction='out', curve_type='ease_in_out'):
     t = np.linspace(0, 1, length)
@@ -77,7 +217,12 @@ def custom_fade_curve(length, direction='out', curve_type='ease_in_out'):
 
     return 1 - curve if direction == 'out' else curve
 # crossfade
-def dynamic_crossfade(song1, song2, transition_point, fade_duration, song1_name="Song 1", song2_name="Song 2", song2_beat=0.0):
+def crossfade_bounds(song1, song2, transition_point, fade_duration, song1_name="Song 1", song2_name="Song 2", song2_beat=0.0):
+    """
+    Frame bounds (out_start, out_end, in_start, in_end) of the fade-out
+    region in song 1 and the fade-in region in song 2. Both tracks must
+    share a sample rate.
+    """
     fade_duration = int(round(fade_duration))
     transition_ms = int(round(transition_point * 1000))
 
@@ -87,54 +232,115 @@ def dynamic_crossfade(song1, song2, transition_point, fade_duration, song1_name=
     fade_in_start = int(song2_beat * 1000)
     fade_in_end = fade_in_start + fade_duration
 
-    if fade_out_start >= len(song1):
-        raise ValueError(f"Transition point {transition_point:.1f}s is too late in {song1_name} (duration: {len(song1)/1000:.1f}s)")
-    if fade_in_end > len(song2):
-        raise ValueError(f"Fade duration {fade_duration}ms is too long at {song2_beat:.2f}s in {song2_name} (duration: {len(song2)/1000:.1f}s)")
+    if fade_out_start >= song1.duration * 1000:
+        raise ValueError(f"Transition point {transition_point:.1f}s is too late in {song1_name} (duration: {song1.duration:.1f}s)")
+    if fade_in_end > song2.duration * 1000:
+        raise ValueError(f"Fade duration {fade_duration}ms is too long at {song2_beat:.2f}s in {song2_name} (duration: {song2.duration:.1f}s)")
 
-    try:
-        fading_out = song1[fade_out_start:fade_out_end]
-        fading_in = song2[fade_in_start:fade_in_end]
+    sr = song1.sr
+    def to_frame(ms):
+        return int(ms * sr // 1000)
 
-        # Convert to numpy arrays
-        samples_out = np.array(fading_out.get_array_of_samples()).astype(np.float32)
-        samples_in = np.array(fading_in.get_array_of_samples()).astype(np.float32)
+    out_start, out_end = to_frame(fade_out_start), min(to_frame(fade_out_end), song1.frames)
+    in_start, in_end = to_frame(fade_in_start), min(to_frame(fade_in_end), song2.frames)
+    return out_start, out_end, in_start, in_end
 
-        # Generate fade curves
-        curve_out = custom_fade_curve(len(samples_out), direction='out', curve_type='ease_in_out')
-        curve_in = custom_fade_curve(len(samples_in), direction='in', curve_type='ease_in_out')
+def render_crossfade(song1, song2, bounds, curve_type='ease_in_out', out=None):
+    """
+    Faded-out song 1 with faded-in song 2 overlaid, for the given bounds.
+    Written into out when given (e.g. a slice of a preallocated mix buffer).
+    """
+    out_start, out_end, in_start, in_end = bounds
+    fade_len = out_end - out_start
+    in_len = in_end - in_start
+    if out is None:
+        out = np.empty((fade_len, max(song1.channels, song2.channels)), dtype=np.float32)
+
+    curve_out = custom_fade_curve(fade_len, direction='out', curve_type=curve_type).astype(np.float32)
+    curve_in = custom_fade_curve(in_len, direction='in', curve_type=curve_type).astype(np.float32)
+    np.multiply(song1.samples[out_start:out_end], curve_out[:, np.newaxis], out=out)
+    overlap = min(fade_len, in_len)
+    out[:overlap] += song2.samples[in_start:in_start + overlap] * curve_in[:overlap, np.newaxis]
+    return out
+
+def dynamic_crossfade(song1, song2, transition_point, fade_duration, song1_name="Song 1", song2_name="Song 2", song2_beat=0.0, curve_type='ease_in_out', out_path=None):
+    """
+    Crossfades two DecodedTracks into one preallocated float32 buffer:
+    song 1 up to the fade, the faded overlap, then song 2 after the fade.
+    Curves are applied in place per frame, so every channel gets the same
+    gain; clipping to int16 happens only when the result is encoded.
+    With out_path the buffer is a memory-mapped PCM file there.
+    """
+    song2 = song2.resampled(song1.sr)
+    bounds = crossfade_bounds(song1, song2, transition_point, fade_duration, song1_name, song2_name, song2_beat)
 
-        # Apply fade curves
-        faded_out = samples_out * curve_out
-        faded_in = samples_in * curve_in
+    try:
+        out_start, out_end, in_start, in_end = bounds
+        fade_len = out_end - out_start
+
+        channels = max(song1.channels, song2.channels)
+        tail = song2.samples[in_end:]
+        shape = (out_start + fade_len + len(tail), channels)
+        if out_path is not None:
+            mixed = allocate_pcm(out_path, shape, song1.sr)
+        else:
+            mixed = np.empty(shape, dtype=np.float32)
 
-        # Convert back to AudioSegments
-        sample_width = fading_out.sample_width
-        array_type = get_array_type(sample_width * 8)
+        # Beginning of song 1
+        mixed[:out_start] = song1.samples[:out_start]
 
-        final_out = fading_out._spawn(array(array_type, faded_out.astype(np.int16)))
-        final_in = fading_in._spawn(array(array_type, faded_in.astype(np.int16)))
+        # Crossfade segment: faded-out song 1 with faded-in song 2 overlaid
+        render_crossfade(song1, song2, bounds, curve_type, out=mixed[out_start:out_start + fade_len])
 
-        # Overlay crossfade segment
-        crossfade_segment = final_out.overlay(final_in)
+        # Remainder of song 2 after the transition
+        mixed[out_start + fade_len:] = tail
 
-        return (
-            song1[:fade_out_start] +        # Beginning of song 1
-            crossfade_segment +             # Crossfade segment
-            song2[fade_in_end:]             # Remainder of song 2 after the transition
-        )
+        return DecodedTrack(mixed, song1.sr, f"{song1_name} x {song2_name}", out_path)
 
     except Exception as e:
         raise RuntimeError(
             f"Failed to create crossfade between {song1_name} and {song2_name} "
-            f"at {transition_point:.1f}s with {fade_duration}ms fade: {str(e)}"
+            f"at {transition_point:.1f}s with {int(round(fade_duration))}ms fade: {str(e)}"
         )
 
 # Whisper Lyrics
-def extract_lyrics_with_timings(audio_path, model_size="tiny"):
+# Process-wide pool of loaded models keyed by (model_size, compute_type).
+# One model serves both transcriptions main() runs in parallel: CTranslate2
+# handles concurrent transcribe() calls with num_workers, and cpu_threads is
+# split between them so the two jobs don't oversubscribe cores.
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", 2))
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", max(1, (os.cpu_count() or 2) // WHISPER_NUM_WORKERS)))
+
+_whisper_models = {}
+_whisper_lock = threading.Lock()
+
+def get_whisper_model(model_size="tiny", compute_type="int8"):
+    key = (model_size, compute_type)
+    with _whisper_lock:
+        model = _whisper_models.get(key)
+        if model is None:
+            logging.info(f"Loading faster-whisper model {model_size} ({compute_type}, "
+                         f"{WHISPER_CPU_THREADS} threads x {WHISPER_NUM_WORKERS} workers)")
+            model = WhisperModel(
+                model_size,
+                compute_type=compute_type,  # "int8" = fastest CPU mode
+                cpu_threads=WHISPER_CPU_THREADS,
+                num_workers=WHISPER_NUM_WORKERS,
+            )
+            _whisper_models[key] = model
+        return model
+
+def warm_whisper_model(model_size="tiny", compute_type="int8"):
+    get_whisper_model(model_size, compute_type)
+
+WHISPER_SAMPLE_RATE = 16000
+
+def extract_lyrics_with_timings(source, model_size="tiny"):
     print("Using faster-whisper for lyrics analysis...")
-    model = WhisperModel(model_size, compute_type="int8")  # "int8" = fastest CPU mode
-    segments, _ = model.transcribe(audio_path, word_timestamps=True)
+    model = get_whisper_model(model_size)
+    # Whisper takes 16 kHz mono float32 directly, no WAV round trip
+    audio = as_track(source).mono(WHISPER_SAMPLE_RATE)
+    segments, _ = model.transcribe(audio, word_timestamps=True)
 
     lyrics = []
     for segment in segments:
@@ -147,6 +353,18 @@ def extract_lyrics_with_timings(audio_path, model_size="tiny"):
             })
     return lyrics
 
+def remap_lyric_timings(word_timings, rate):
+    """
+    Maps word timings from the original audio onto a version time-stretched
+    by a constant rate (rate > 1 plays faster, so times shrink by 1/rate).
+    """
+    if rate == 1.0:
+        return word_timings
+    return [
+        {**word, "start": word["start"] / rate, "end": word["end"] / rate}
+        for word in word_timings
+    ]
+
 def group_lyrics_into_lines(word_timings, max_pause=0.5):
     lines = []
     current_line = []
@@ -198,26 +416,28 @@ def find_phrase_starts(lyric_lines, bar_duration, min_pause=1.5):
             phrase_starts.append(bar_start)
     return phrase_starts
 
-def get_lyrics_with_cache(file_path, model_size="tiny"):
-    base_name = os.path.basename(file_path)
-    cache_dir = ".cache"
-    os.makedirs(cache_dir, exist_ok=True)
-
-    cache_file = os.path.join(
-        cache_dir,
-        f"{base_name}.{model_size}.v1.lyrics_cache"
-    )
-
-    if os.path.exists(cache_file):
-        with open(cache_file, 'rb') as f:
-            return pickle.load(f)
+def get_lyrics_with_cache(source, model_size="tiny"):
+    # Keyed on the audio content, not the file name: uploads are always
+    # saved under the same paths
+    track = as_track(source)
+    cache_key = f"{track.content_hash()}.{model_size}.{LYRICS_CACHE_VERSION}"
+    cached = lyrics_cache.get(cache_key)
+    if cached is not None:
+        return [
+            {"word": str(w), "start": float(s), "end": float(e), "confidence": float(c)}
+            for w, s, e, c in zip(cached["word"], cached["start"], cached["end"], cached["confidence"])
+        ]
 
     # Run transcription
-    lyrics = extract_lyrics_with_timings(file_path, model_size)
-    
-    with open(cache_file, 'wb') as f:
-        pickle.dump(lyrics, f)
-        
+    lyrics = extract_lyrics_with_timings(track, model_size)
+
+    lyrics_cache.put(
+        cache_key,
+        word=np.array([w["word"] for w in lyrics], dtype=str),
+        start=np.array([w["start"] for w in lyrics], dtype=np.float64),
+        end=np.array([w["end"] for w in lyrics], dtype=np.float64),
+        confidence=np.array([w["confidence"] for w in lyrics], dtype=np.float32),
+    )
     return lyrics
 
 # Transition Tools
@@ -236,60 +456,98 @@ def calculate_optimal_fade(tempo, energy, current_time, energy_times, beats):
     fade_duration = max(8, min(12, fade_beats * beat_duration))
     return fade_duration * 1000
 
+def _optimal_fades(tempo, beat_energy, max_energy):
+    # calculate_optimal_fade for an array of beats, in seconds. Same operations
+    # in the same order (including the ms round trip) so results match exactly.
+    energy_factor = 1.5 - (beat_energy / max_energy)
+    fade_beats = 10 * energy_factor
+    beat_duration = 60 / tempo
+    fade_duration = np.maximum(8, np.minimum(12, fade_beats * beat_duration))
+    return (fade_duration * 1000) / 1000
+
 def find_best_fade_window(beats, non_lyric_intervals, tempo, energy, energy_times):
-    candidate_points = []
-    for interval_start, interval_end in non_lyric_intervals:
-        if interval_end - interval_start < 2:
-            continue
-        interval_beats = [b for b in beats if interval_start <= b <= interval_end]
-        for beat in interval_beats:
-            potential_fade = calculate_optimal_fade(
-                tempo, energy, beat, energy_times, beats
-            ) / 1000
-            fade_start = beat - (potential_fade/2)
-            fade_end = beat + (potential_fade/2)
-            if fade_start >= interval_start and fade_end <= interval_end:
-                energy_score = 1 - abs(0.5 - (np.interp(beat, energy_times, energy)/np.max(energy)))
-                duration_score = min(1, potential_fade/8)
-                score = energy_score * duration_score
-                candidate_points.append((score, beat, potential_fade))
-    if not candidate_points:
+    """
+    Best beat to center a fade on, scored by energy and fade length, where
+    the whole fade fits inside one non-lyric interval of at least 2s.
+    Intervals must be in time order and non-overlapping, as produced by
+    find_non_lyric_intervals. Returns (fade_ms, beat) or (None, None).
+    """
+    beats_array = np.asarray(beats, dtype=np.float64).reshape(-1)
+    intervals = np.asarray(non_lyric_intervals, dtype=np.float64).reshape(-1, 2)
+    intervals = intervals[~(intervals[:, 1] - intervals[:, 0] < 2)]
+    if len(beats_array) == 0 or len(intervals) == 0:
         return None, None
-    best_candidate = max(candidate_points, key=lambda x: x[0])
-    return best_candidate[2] * 1000, best_candidate[1]
+    intervals = intervals[np.argsort(intervals[:, 0], kind="stable")]
+
+    # One interpolation and one max for all beats instead of one per beat
+    beat_energy = np.interp(beats_array, energy_times, energy)
+    max_energy = np.max(energy)
+    fades = _optimal_fades(tempo, beat_energy, max_energy)
+    fade_starts = beats_array - (fades / 2)
+    fade_ends = beats_array + (fades / 2)
+
+    # The only interval that can hold a fade is the last one starting at or before it
+    interval_index = np.searchsorted(intervals[:, 0], fade_starts, side="right") - 1
+    holder = np.maximum(interval_index, 0)
+    valid = (interval_index >= 0) & (fade_starts >= intervals[holder, 0]) & (fade_ends <= intervals[holder, 1])
+    if not valid.any():
+        return None, None
+
+    energy_scores = 1 - np.abs(0.5 - (beat_energy / max_energy))
+    duration_scores = np.minimum(1, fades / 8)
+    scores = energy_scores * duration_scores
+
+    # Ties go to the first candidate in interval-then-beat order, as max() over
+    # the old per-interval candidate list did
+    candidates = np.flatnonzero(valid)
+    candidates = candidates[np.lexsort((candidates, interval_index[candidates]))]
+    best = candidates[np.argmax(scores[candidates])]
+    return fades[best] * 1000, beats[best]
 
 def get_safe_transition_points(beats, non_lyric_intervals, fade_duration):
-    safe_beats = []
+    """Beats whose centered fade window fits in some non-lyric interval (with margin)."""
     margin = 0.25
-    for beat in beats:
-        window_start = beat - fade_duration / 2
-        window_end = beat + fade_duration / 2
-        if window_start < 0:
-            continue
-        for interval_start, interval_end in non_lyric_intervals:
-            if (interval_start - margin) <= window_start and (window_end <= interval_end + margin):
-                safe_beats.append(beat)
-                break
-    return safe_beats
-
-def extend_with_loop(audio_segment, interval_start, interval_end, target_duration):
+    beats_array = np.asarray(beats, dtype=np.float64).reshape(-1)
+    intervals = np.asarray(non_lyric_intervals, dtype=np.float64).reshape(-1, 2)
+    if len(beats_array) == 0 or len(intervals) == 0:
+        return []
+
+    window_starts = beats_array - fade_duration / 2
+    window_ends = beats_array + fade_duration / 2
+
+    # Some interval starting (minus margin) at or before the window reaches
+    # past its end iff the furthest end among those intervals does
+    order = np.argsort(intervals[:, 0] - margin, kind="stable")
+    padded_starts = (intervals[:, 0] - margin)[order]
+    furthest_ends = np.maximum.accumulate((intervals[:, 1] + margin)[order])
+
+    last = np.searchsorted(padded_starts, window_starts, side="right") - 1
+    safe = (window_starts >= 0) & (last >= 0) & (window_ends <= furthest_ends[np.maximum(last, 0)])
+    return [beats[i] for i in np.flatnonzero(safe)]
+
+def beats_near(beats, points, tolerance=0.5):
+    """Beats within tolerance of any of points (e.g. phrase starts), in beat order."""
+    points = np.sort(np.asarray(points, dtype=np.float64).reshape(-1))
+    beats_array = np.asarray(beats, dtype=np.float64).reshape(-1)
+    if len(points) == 0 or len(beats_array) == 0:
+        return []
+    right = np.clip(np.searchsorted(points, beats_array), 0, len(points) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.minimum(np.abs(beats_array - points[left]), np.abs(beats_array - points[right]))
+    return [beats[i] for i in np.flatnonzero(nearest < tolerance)]
+
+def extend_with_loop(track, interval_start, interval_end, target_duration):
     loop_duration = interval_end - interval_start
     if loop_duration <= 0:
         raise ValueError(f"Invalid loop segment: start={interval_start}, end={interval_end}") 
-    loop_segment = audio_segment[interval_start*1000 : interval_end*1000]
+    start_frame = int(interval_start * track.sr)
+    end_frame = int(interval_end * track.sr)
     needed_loops = int(np.ceil((target_duration - loop_duration) / loop_duration))
-    extended = loop_segment * needed_loops
+    samples = track.samples
+    extended = np.concatenate([
+        samples[:start_frame],
+        np.tile(samples[start_frame:end_frame], (max(0, needed_loops), 1)),
+        samples[end_frame:],
+    ])
     transition_point = interval_end
-    before = audio_segment[:interval_start*1000]
-    after = audio_segment[interval_end*1000:]
-    return before + extended + after, transition_point
-
-def threaded_run(func, *args):
-    result = {}
-
-    def wrapper():
-        result["value"] = func(*args)
-
-    thread = threading.Thread(target=wrapper)
-    thread.start()
-    return thread, result
+    return DecodedTrack(extended, track.sr, track.name), transition_point
@@ -0,0 +1,106 @@
+"""
+Benchmark for the transition search: the vectorized find_best_fade_window,
+get_safe_transition_points and beats_near against the per-beat loops they
+replaced, on a synthetic long track with a dense beat grid. Also checks that
+both versions return identical results.
+
+    python bench_transition.py [minutes] [bpm]
+"""
+import sys
+import time
+import numpy as np
+from audiomix import (find_best_fade_window, get_safe_transition_points, beats_near,
+                      calculate_optimal_fade)
+
+# Reference implementations, as they were before vectorizing
+def legacy_find_best_fade_window(beats, non_lyric_intervals, tempo, energy, energy_times):
+    candidate_points = []
+    for interval_start, interval_end in non_lyric_intervals:
+        if interval_end - interval_start < 2:
+            continue
+        interval_beats = [b for b in beats if interval_start <= b <= interval_end]
+        for beat in interval_beats:
+            potential_fade = calculate_optimal_fade(
+                tempo, energy, beat, energy_times, beats
+            ) / 1000
+            fade_start = beat - (potential_fade/2)
+            fade_end = beat + (potential_fade/2)
+            if fade_start >= interval_start and fade_end <= interval_end:
+                energy_score = 1 - abs(0.5 - (np.interp(beat, energy_times, energy)/np.max(energy)))
+                duration_score = min(1, potential_fade/8)
+                score = energy_score * duration_score
+                candidate_points.append((score, beat, potential_fade))
+    if not candidate_points:
+        return None, None
+    best_candidate = max(candidate_points, key=lambda x: x[0])
+    return best_candidate[2] * 1000, best_candidate[1]
+
+def legacy_get_safe_transition_points(beats, non_lyric_intervals, fade_duration):
+    safe_beats = []
+    margin = 0.25
+    for beat in beats:
+        window_start = beat - fade_duration / 2
+        window_end = beat + fade_duration / 2
+        if window_start < 0:
+            continue
+        for interval_start, interval_end in non_lyric_intervals:
+            if (interval_start - margin) <= window_start and (window_end <= interval_end + margin):
+                safe_beats.append(beat)
+                break
+    return safe_beats
+
+def legacy_beats_near(beats, points, tolerance=0.5):
+    return [b for b in beats if any(abs(b - p) < tolerance for p in points)]
+
+def synthetic_track(minutes, bpm, sr=44100, hop=512, seed=0):
+    rng = np.random.default_rng(seed)
+    duration = minutes * 60
+    beats = list(np.arange(0.37, duration, 60 / bpm))
+
+    frames = int(duration * sr / hop)
+    energy = np.abs(np.cumsum(rng.normal(0, 0.01, frames))).astype(np.float32) + 0.05
+    energy_times = np.arange(frames) * hop / sr
+
+    # Alternating sung lines and gaps, like find_non_lyric_intervals output
+    intervals = []
+    t = 0.0
+    while t < duration:
+        gap = rng.uniform(0.5, 20.0)
+        intervals.append((t, min(duration, t + gap)))
+        t += gap + rng.uniform(2.0, 15.0)
+
+    bar = 4 * 60 / bpm
+    phrase_starts = [round(s / bar) * bar for s, _ in intervals[1:]]
+    return beats, intervals, energy, energy_times, phrase_starts
+
+def timed(func, *args, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bpm = float(sys.argv[2]) if len(sys.argv) > 2 else 174
+    beats, intervals, energy, energy_times, phrase_starts = synthetic_track(minutes, bpm)
+    print(f"{minutes:g} min at {bpm:g} BPM: {len(beats)} beats, {len(intervals)} non-lyric intervals, {len(energy)} energy frames")
+
+    cases = [
+        ("find_best_fade_window", legacy_find_best_fade_window, find_best_fade_window,
+         (beats, intervals, bpm, energy, energy_times)),
+        ("get_safe_transition_points", legacy_get_safe_transition_points, get_safe_transition_points,
+         (beats, intervals, 60 * 16 / bpm)),
+        ("phrase beat filter", legacy_beats_near, beats_near,
+         (beats, phrase_starts, 0.5)),
+    ]
+    for name, legacy, vectorized, args in cases:
+        expected, legacy_time = timed(legacy, *args, repeat=1)
+        result, new_time = timed(vectorized, *args)
+        assert result == expected, f"{name}: {result!r} != {expected!r}"
+        print(f"{name:28s} loop {legacy_time * 1000:9.1f} ms   vectorized {new_time * 1000:7.2f} ms   "
+              f"x{legacy_time / new_time:,.0f}   identical")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from pydub import AudioSegment
+import librosa
+import numpy as np
+import os
+import tempfile
+import threading
+from audio_cache import hash_audio, hash_file
+from pcm_store import PcmStore, read_pcm, write_pcm
+
+# Decoded inputs are kept as memory-mapped PCM keyed by the file's hash, so
+# a re-upload skips ffmpeg and every stage and worker shares the same pages
+DECODE_CACHE_VERSION = "v1"
+decoded_store = PcmStore("decoded", max_bytes=int(os.getenv("DECODED_CACHE_BYTES", 2 * 1024 * 1024 * 1024)))
+
+class DecodedTrack:
+    """
+    A track decoded once into float32 PCM, shape (frames, channels), in [-1, 1].
+    Analysis, stretching, transcription and mixing all read from this buffer;
+    mono and resampled views are built on first use and kept for reuse.
+    path is the PCM file the samples are memory-mapped from, if any, and
+    content_hash a key already known to identify the samples.
+    """
+    def __init__(self, samples, sr, name="track", path=None, content_hash=None):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        self.samples = samples
+        self.sr = int(sr)
+        self.name = name
+        self.path = path
+        self._views = {}
+        self._hash = content_hash
+        self._lock = threading.Lock()
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def frames(self):
+        return self.samples.shape[0]
+
+    @property
+    def duration(self):
+        return self.frames / self.sr
+
+    def mono(self, sr=None):
+        """Mono view, optionally resampled to sr. Cached per rate."""
+        sr = int(sr or self.sr)
+        view = self._views.get(sr)
+        if view is not None:
+            return view
+
+        # Built outside the lock so a slow resample for Whisper doesn't
+        # block analysis asking for the native-rate view
+        if sr != self.sr:
+            y = librosa.resample(self.mono(), orig_sr=self.sr, target_sr=sr)
+        else:
+            y = self.samples.mean(axis=1) if self.channels > 1 else self.samples[:, 0]
+        y = np.ascontiguousarray(y, dtype=np.float32)
+        with self._lock:
+            return self._views.setdefault(sr, y)
+
+    def resampled(self, sr):
+        """Full-channel copy at another sample rate (self if it already matches)."""
+        if int(sr) == self.sr:
+            return self
+        y = librosa.resample(self.samples, orig_sr=self.sr, target_sr=int(sr), axis=0)
+        return DecodedTrack(y, sr, self.name)
+
+    def content_hash(self):
+        with self._lock:
+            if self._hash is None:
+                self._hash = hash_audio(self.samples, self.sr)
+            return self._hash
+
+def _decode(file_path):
+    segment = AudioSegment.from_file(file_path)
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, segment.channels)
+    samples /= float(1 << (8 * segment.sample_width - 1))
+    return samples, segment.frame_rate
+
+def decode_audio(file_path, name=None, store=True):
+    """
+    Decode any ffmpeg-readable file into a DecodedTrack, memory-mapped from
+    the decoded store. Only a file not seen before goes through ffmpeg.
+    store=False decodes into memory and leaves the store alone, for batch
+    jobs that would otherwise evict the tracks live mixes are using.
+    """
+    name = name or os.path.basename(file_path)
+    if not store:
+        samples, sr = _decode(file_path)
+        return DecodedTrack(samples, sr, name)
+
+    cache_key = f"{hash_file(file_path)}.{DECODE_CACHE_VERSION}"
+    cached = decoded_store.get(cache_key)
+    if cached is None:
+        cached = decoded_store.put(cache_key, *_decode(file_path))
+    samples, sr = cached
+    # Not mapped if the store evicted it at once (larger than its budget)
+    path = decoded_store.path(cache_key) if isinstance(samples, np.memmap) else None
+    # Decoding is deterministic, so the file's key also identifies the samples
+    # and the analysis, lyrics and stretch caches needn't hash them again
+    return DecodedTrack(samples, sr, name, path, content_hash=cache_key)
+
+def as_track(source):
+    """Accept either a DecodedTrack or a path to decode."""
+    if isinstance(source, DecodedTrack):
+        return source
+    return decode_audio(source)
+
+def save_track(track, path):
+    """
+    Writes a track as a PCM file. A track already mapped from one is
+    hard-linked instead of copied, so both names share the same pages.
+    """
+    if track.path is not None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(track.path, tmp_path)
+            os.replace(tmp_path, path)
+            return
+        except OSError:
+            # Another filesystem, or the source was evicted meanwhile
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    write_pcm(path, track.samples, track.sr)
+
+def load_track(path, name=None):
+    """A track written by save_track, memory-mapped instead of read into memory."""
+    samples, sr = read_pcm(path)
+    return DecodedTrack(samples, sr, name or os.path.basename(path), path)
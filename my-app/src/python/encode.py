@@ -0,0 +1,105 @@
+from pydub import AudioSegment
+import numpy as np
+import os
+import subprocess
+import tempfile
+import threading
+import logging
+logging.basicConfig(level=logging.INFO)
+
+CHUNK_SECONDS = 2
+READ_SIZE = 64 * 1024
+
+def _pcm_chunks(blocks, sr, channels, chunk_seconds=CHUNK_SECONDS):
+    """int16 PCM bytes for float32 (frames, channels) blocks, converted a chunk at a time."""
+    step = max(1, int(sr * chunk_seconds))
+    for block in blocks:
+        for start in range(0, len(block), step):
+            chunk = block[start:start + step]
+            if chunk.shape[1] != channels:
+                chunk = np.broadcast_to(chunk, (len(chunk), channels))
+            yield np.clip(chunk * 32768.0, -32768, 32767).astype(np.int16).tobytes()
+
+def stream_mp3(track, persist_path=None, bitrate="128k", chunk_seconds=CHUNK_SECONDS, on_complete=None):
+    """
+    Encodes a DecodedTrack to MP3 by piping PCM through ffmpeg, yielding
+    encoded bytes as soon as ffmpeg produces them. If persist_path is given
+    the same bytes are also written there (renamed into place once complete).
+    on_complete() is called after that, only if the encode finished.
+    """
+    return stream_mp3_blocks([track.samples], track.sr, track.channels, persist_path, bitrate, chunk_seconds,
+                             on_complete)
+
+def stream_mp3_blocks(blocks, sr, channels, persist_path=None, bitrate="128k", chunk_seconds=CHUNK_SECONDS,
+                      on_complete=None):
+    """
+    Like stream_mp3, for audio produced piece by piece: blocks is an
+    iterable of float32 (frames, channels) arrays, consumed lazily as the
+    encoder needs more input. Mono blocks are upmixed to channels.
+    """
+    process = subprocess.Popen(
+        [
+            AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(sr), "-ac", str(channels), "-i", "pipe:0",
+            "-f", "mp3", "-b:a", bitrate, "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+    errors = []
+
+    def feed():
+        try:
+            for pcm in _pcm_chunks(blocks, sr, channels, chunk_seconds):
+                process.stdin.write(pcm)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            # Producing the audio failed; surfaced to the consumer below
+            errors.append(e)
+        finally:
+            process.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+
+    out = None
+    tmp_path = None
+    if persist_path:
+        # Unique temp name: two encodes may persist to the same file at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(persist_path) or ".", suffix=".part")
+        out = os.fdopen(fd, "wb")
+
+    completed = False
+    try:
+        for data in iter(lambda: process.stdout.read(READ_SIZE), b""):
+            if out:
+                out.write(data)
+            yield data
+        writer.join()
+        completed = process.wait() == 0 and not errors
+        if errors:
+            raise errors[0]
+    finally:
+        # Client disconnects land here too; don't leave ffmpeg running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        writer.join()
+        process.stdout.close()
+        if out:
+            out.close()
+            if completed:
+                os.replace(tmp_path, persist_path)
+            else:
+                os.remove(tmp_path)
+                logging.info(f"MP3 encode did not complete; {persist_path} not written")
+    if completed and on_complete is not None:
+        on_complete()
+
+def export_mp3(track, output_path, bitrate="128k"):
+    """Encode a DecodedTrack straight to an MP3 file."""
+    for _ in stream_mp3(track, persist_path=output_path, bitrate=bitrate):
+        pass
+    return output_path
@@ -0,0 +1,84 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+import os
+import sys
+import threading
+
+# Process pool for CPU-bound, GIL-holding work (librosa analysis); thread pool
+# for work that waits on ffmpeg/rubberband subprocesses or releases the GIL
+# (decoding, Whisper). Both are created on first use and shared process-wide.
+_process_pool = None
+_thread_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # Read lazily so job workers can lower it before first use
+            workers = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 2))
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+def get_thread_pool():
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=int(os.getenv("IO_WORKERS", 8)))
+        return _thread_pool
+
+def run_in_thread(func, *args, **kwargs):
+    """Returns a Future; result() re-raises anything func raised."""
+    return get_thread_pool().submit(func, *args, **kwargs)
+
+def run_in_process(func, *args, **kwargs):
+    """Returns a Future; func and its arguments must be picklable."""
+    return get_process_pool().submit(func, *args, **kwargs)
+
+def map_processes(func, items):
+    """Ordered results of func over items on the process pool; the first error is raised."""
+    return list(get_process_pool().map(func, items))
+
+def _call_with_shared(func, name, shape, dtype, args, kwargs):
+    # The parent owns and unlinks the block. Spawned workers share its
+    # resource tracker, so attaching only repeats the parent's registration
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    try:
+        return func(array, *args, **kwargs)
+    finally:
+        del array
+        try:
+            shm.close()
+        except BufferError:
+            # func kept a view alive; the mapping goes away with the process
+            pass
+
+def run_with_shared_array(func, array, *args, **kwargs):
+    """
+    Runs func(shared_view, *args, **kwargs) on the process pool without
+    pickling array: it is copied once into shared memory, which the worker
+    maps directly. The block is released when the future completes.
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+    try:
+        future = get_process_pool().submit(_call_with_shared, func, shm.name, array.shape, array.dtype.str, args, kwargs)
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+
+    def release(_):
+        shm.close()
+        shm.unlink()
+
+    future.add_done_callback(release)
+    return future
@@ -0,0 +1,82 @@
+import librosa
+import numpy as np
+import os
+from BeatDetectionAlgo import section_features, section_transitions
+
+N_FFT = 2048
+HOP_LENGTH = 512
+# Features can be extracted from a mono copy decimated to this rate; 0 (the
+# default) keeps the track's own rate. Mixing always uses the full-rate
+# buffer. 22050 is ~4x faster but fails regress_analysis.py on the bundled
+# tracks, so it stays opt-in until that passes.
+ANALYSIS_SR = int(os.getenv("ANALYSIS_SR", 0))
+
+class TrackAnalysis:
+    """
+    Compact analysis of one track: tempo (BPM), beat times (s), key index,
+    RMS energy per frame with the frame times, mean spectral centroid (Hz)
+    and section boundaries (s). Holds no audio; all times are in seconds
+    whatever rate the features were extracted at.
+    """
+    __slots__ = ("tempo", "beats", "key", "energy", "energy_times", "centroid", "sections", "sr", "hop_length")
+
+    ARRAYS = ("beats", "energy", "sections")
+
+    def __init__(self, tempo, beats, key, energy, centroid, sections, sr, hop_length=HOP_LENGTH):
+        self.tempo = float(np.atleast_1d(tempo)[0])
+        self.beats = np.asarray(beats, dtype=np.float64)
+        self.key = int(key)
+        self.energy = np.asarray(energy, dtype=np.float32)
+        self.energy_times = librosa.frames_to_time(np.arange(len(self.energy)), sr=sr, hop_length=hop_length)
+        self.centroid = float(centroid)
+        self.sections = np.asarray(sections, dtype=np.float64)
+        self.sr = int(sr)
+        self.hop_length = int(hop_length)
+
+    def to_arrays(self):
+        """NumPy arrays for NpzCache.put; energy_times is rebuilt on load."""
+        return {
+            "tempo": np.float64(self.tempo),
+            "beats": self.beats,
+            "key": np.int8(self.key),
+            "energy": self.energy,
+            "centroid": np.float64(self.centroid),
+            "sections": self.sections,
+            "sr": np.int32(self.sr),
+            "hop_length": np.int32(self.hop_length),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["tempo"], arrays["beats"], arrays["key"], arrays["energy"], arrays["centroid"],
+                   arrays["sections"], int(arrays["sr"]), int(arrays["hop_length"]))
+
+def extract_features(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, beats=True, sections=True):
+    """
+    Every per-track feature from one STFT of mono y: the onset envelope (for
+    tempo and beat tracking), chroma (key), RMS energy, spectral centroid
+    and, optionally, section boundaries. beats=False estimates tempo from
+    the onset envelope alone, without tracking beats (or sections).
+    """
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+    power = S ** 2
+
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr, n_fft=n_fft))
+    onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    if beats:
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+        beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=hop_length)
+    else:
+        tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+        beat_times = np.empty(0)
+
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    key = np.argmax(np.mean(chroma, axis=1))
+    energy = librosa.feature.rms(S=S, frame_length=n_fft, hop_length=hop_length)[0]
+    centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length).mean()
+
+    boundaries = ()
+    if beats and sections:
+        boundaries = section_transitions(section_features(S, sr, n_fft), sr, hop_length, beats=beat_times)
+
+    return TrackAnalysis(tempo, beat_times, key, energy, centroid, boundaries, sr, hop_length)
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import logging
+logging.basicConfig(level=logging.INFO)
+
+MIX_WORKERS = int(os.getenv("MIX_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 32))
+JOB_TTL = int(os.getenv("JOB_TTL", 3600))  # s a finished job stays queryable
+
+class QueueFullError(Exception):
+    pass
+
+def _worker_init():
+    # Jobs already run in parallel, so each gets a small analysis pool
+    os.environ.setdefault("ANALYSIS_WORKERS", "2")
+    # Each worker loads Whisper once for all the jobs it runs
+    from audiomix import warm_whisper_model
+    warm_whisper_model()
+
+def _run_job(job_id, progress, func, args):
+    """Executed in a worker process; reports stage progress through a shared dict."""
+    def report(stage, fraction):
+        progress[job_id] = {"stage": stage, "progress": round(float(fraction), 3)}
+
+    report("running", 0.0)
+    result = func(*args, progress=report)
+    report("done", 1.0)
+    return result
+
+class JobQueue:
+    """
+    Runs mix jobs on a bounded process pool. Submitting returns a job id
+    right away; status() reports the current stage and progress, and
+    result() returns the job's return value once it has finished. Finished
+    jobs are forgotten ttl seconds after they end.
+    """
+    def __init__(self, max_workers=MIX_WORKERS, max_queued=MAX_QUEUED_JOBS, ttl=JOB_TTL):
+        # spawn, not fork: forked children would inherit the Flask process's
+        # threads and the CTranslate2 thread pool in a broken state
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_worker_init)
+        self.manager = context.Manager()
+        self.progress = self.manager.dict()
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _sweep(self):
+        # Called with the lock held
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["finished"] is not None and job["finished"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+            self.progress.pop(job_id, None)
+
+    def submit(self, func, *args):
+        with self._lock:
+            self._sweep()
+            pending = sum(1 for job in self.jobs.values() if not job["future"].done())
+            if pending >= self.max_queued:
+                raise QueueFullError(f"{pending} mix jobs already pending")
+
+            job_id = uuid.uuid4().hex
+            self.progress[job_id] = {"stage": "queued", "progress": 0.0}
+            future = self.executor.submit(_run_job, job_id, self.progress, func, args)
+            job = {"future": future, "submitted": time.time(), "finished": None}
+            self.jobs[job_id] = job
+        future.add_done_callback(lambda _: job.update(finished=time.time()))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            self._sweep()
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        future = job["future"]
+        status = {"job_id": job_id, **self.progress.get(job_id, {})}
+        if not future.done():
+            status["state"] = "running" if future.running() else "queued"
+        elif future.exception() is not None:
+            status["state"] = "failed"
+            status["error"] = str(future.exception())
+        else:
+            status["state"] = "done"
+        status["elapsed"] = round(time.time() - job["submitted"], 1)
+        return status
+
+    def result(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or not job["future"].done():
+            return None
+        return job["future"].result()
+
+    def forget(self, job_id):
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            self.progress.pop(job_id, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
@@ -0,0 +1,107 @@
+import json
+import os
+import logging
+from audio_cache import CACHE_ROOT, hash_file
+from decode import decode_audio
+from features import ANALYSIS_SR, extract_features
+from executor import map_processes
+logging.basicConfig(level=logging.INFO)
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+INDEX_VERSION = 2
+INDEX_BATCH_SIZE = 64
+
+def recommender_features(file_path):
+    """
+    Only what AIDJ uses: tempo, key and spectral centroid, from the shared
+    single-STFT extractor. Tempo comes from the onset envelope directly,
+    with no beat tracking. Extracted at ANALYSIS_SR, like mix analysis.
+    """
+    # Kept out of the decoded store: a library refresh would flood it
+    track = decode_audio(file_path, store=False)
+    sr = min(ANALYSIS_SR or track.sr, track.sr)
+    analysis = extract_features(track.mono(sr), sr, beats=False)
+
+    return {
+        'tempo': int(analysis.tempo),
+        'key': analysis.key,
+        'energy': analysis.centroid,
+        'hash': hash_file(file_path),
+    }
+
+class LibraryIndex:
+    """
+    Persistent per-track recommender features for a song directory.
+    refresh() only analyzes files that are new or whose size/mtime changed
+    (and whose content hash actually differs), spread over the process pool.
+    """
+    def __init__(self, directory="test_songs", index_path=os.path.join(CACHE_ROOT, "library_index.json")):
+        self.directory = directory
+        self.index_path = index_path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("directory") == self.directory:
+            self.entries = data["entries"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "directory": self.directory, "entries": self.entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self):
+        """Brings the index up to date with the directory. Returns (analyzed, removed) names."""
+        current = {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.lower().endswith(AUDIO_EXTENSIONS) and os.path.isfile(path):
+                st = os.stat(path)
+                current[name] = (st.st_mtime, st.st_size)
+
+        removed = [name for name in self.entries if name not in current]
+        for name in removed:
+            del self.entries[name]
+
+        stale = []
+        touched = False
+        for name, (mtime, size) in current.items():
+            entry = self.entries.get(name)
+            if entry and entry["mtime"] == mtime and entry["size"] == size:
+                continue
+            # Touched but unchanged (copied, re-downloaded): keep the features
+            if entry and entry["size"] == size and entry["features"]["hash"] == hash_file(os.path.join(self.directory, name)):
+                entry["mtime"] = mtime
+                touched = True
+                continue
+            stale.append(name)
+
+        if stale:
+            logging.info(f"Indexing {len(stale)} new or changed tracks")
+        # Saved after every batch so an interrupted rebuild keeps its progress
+        for start in range(0, len(stale), INDEX_BATCH_SIZE):
+            batch = stale[start:start + INDEX_BATCH_SIZE]
+            features = map_processes(recommender_features, [os.path.join(self.directory, name) for name in batch])
+            for name, track_features in zip(batch, features):
+                mtime, size = current[name]
+                self.entries[name] = {"mtime": mtime, "size": size, "features": track_features}
+            self.save()
+
+        # Keep entries in directory order so rebuilds are deterministic
+        self.entries = {name: self.entries[name] for name in current}
+        if stale or removed or touched:
+            self.save()
+        return stale, removed
+
+    def track_features(self):
+        return {
+            name: {k: v for k, v in entry["features"].items() if k != "hash"}
+            for name, entry in self.entries.items()
+        }
@@ -1,74 +1,286 @@
 from audiomix import *
-from Ai_DJ_DB import *
 from random_song import *
+from decode import decoded_store
+from pipeline import mix_tracks, mix_workspace, mix_job, analyze_workspace, transition_candidates, render_workspace, release_mix, fade_ms, FADE_BEATS
+from workspace import Workspace, WorkspaceBudgetError
+from playlist import mix_playlist
+from jobs import JobQueue, QueueFullError
+from encode import stream_mp3
 from pydub import AudioSegment
 import numpy as np
-from flask import Flask,jsonify,request,send_file,send_from_directory
+from flask import Flask,jsonify,request,send_file,send_from_directory,Response,stream_with_context
 from flask_cors import CORS
 import os
 import logging
 import warnings
 import shutil
+import json
+import math
 
 logging.basicConfig(level=logging.INFO)
 
 app = Flask(__name__)
 CORS(app)
 
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ml_model = AIDJ()
-#ml_model.build_music_graph()
-#ml_model.save_model()
-ml_model.load_model()
+mix_jobs = None
 
-song_paths = {}
-tempo = {}
-key = {}
+def init_server():
+    """
+    Loads the recommender and Whisper and starts the job pool. Only called
+    from the __main__ block: spawned workers re-import this module as
+    __mp_main__ (before parent_process() is set) and must not repeat it.
+    """
+    global mix_jobs
+    #ml_model.build_music_graph()
+    #ml_model.save_model()
+    ml_model.load_model()
 
-#global variables for main()
-MIN_INTRO_DURATION = 30
-MIN_FADE_DURATION = 5000
-MAX_FADE_DURATION = 30000
+    # Load Whisper once at startup instead of on every transcription
+    warm_whisper_model()
+
+    mix_jobs = JobQueue()
 
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
+def request_workspace():
+    """The workspace named by the request's session id, if it exists."""
+    session_id = request.args.get("session") or request.form.get("session_id")
+    if session_id is None and request.is_json:
+        session_id = (request.get_json(silent=True) or {}).get("session_id")
+    return Workspace.open(session_id)
+
 @app.route('/api/mix_songs', methods=['GET'])
 def mix_song():
-    if os.listdir("uploads"):
-        output = main("uploads/song1.mp3", "uploads/song2.mp3")
+    workspace = request_workspace()
+    if workspace is None:
+        return jsonify({"message": "Unknown or expired session"}), 404
+
+    if request.args.get("stream") == "1":
+        # Encode while sending: the first bytes go out as soon as analysis
+        # and the crossfade are done, and the file is still kept for save_to_db
+        try:
+            mixed_song, mix_info = mix_tracks(workspace.file("song1.mp3"), workspace.file("song2.mp3"), workspace=workspace)
+        except WorkspaceBudgetError as e:
+            return jsonify({"message": str(e)}), 413
+        except Exception as e:
+            logging.info(f"Mix failed: {str(e)}")
+            return jsonify({"message": "Unable to mix songs"}), 500
+        # Recorded only once mixed_song.mp3 is in place, so save_to_db never
+        # pairs this mix's details with an older or missing file
+        stream = stream_mp3(mixed_song, persist_path=workspace.file("mixed_song.mp3"),
+                            on_complete=lambda: workspace.save_result(mix_info))
+
+        response = Response(
+            stream_with_context(stream),
+            mimetype="audio/mpeg",
+            headers={"Content-Disposition": "attachment; filename=mixed_song.mp3"},
+        )
+        # Whether the encode finished or the client went away
+        response.call_on_close(lambda: release_mix(mixed_song))
+        return response
+
+    output = main(workspace)
+    if output is None:
+        return jsonify({"message": "Unable to mix songs"}), 500
+    return send_file(output, mimetype="audio/mpeg", as_attachment=True)
+
 
-        files = os.listdir('uploads')
-        for file in files:
-            file_path = os.path.join('uploads', file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+MAX_TRANSITION_CANDIDATES = 20
 
-        return send_file(output, mimetype="audio/mpeg", as_attachment=True)
+@app.route('/api/transitions', methods=['GET'])
+def transitions():
+    workspace = request_workspace()
+    if workspace is None:
+        return jsonify({"message": "Unknown or expired session"}), 404
+
+    try:
+        k = int(request.args.get("k", 5))
+    except ValueError:
+        k = 0
+    if k < 1:
+        return jsonify({"message": "k must be a positive integer"}), 400
+    k = min(k, MAX_TRANSITION_CANDIDATES)
+
+    # Analysis is saved in the workspace, so only the first call (or a
+    # prior mix) pays for it; every later call just rescores
+    try:
+        analysis = analyze_workspace(workspace)
+    except WorkspaceBudgetError as e:
+        return jsonify({"message": str(e)}), 413
+    except Exception as e:
+        logging.info(f"Analysis failed: {str(e)}")
+        return jsonify({"message": "Unable to analyze songs"}), 500
 
+    return jsonify({
+        "session_id": workspace.id,
+        "tempo1": analysis["tempo1"],
+        "tempo2": analysis["tempo2"],
+        "candidates": transition_candidates(analysis, k),
+    })
+
+@app.route('/api/render', methods=['POST'])
+def render_mix():
+    """
+    Re-mixes a session from its saved analysis with the given overrides, e.g.
+    {"session_id": ..., "transition_point": 92.4, "fade_beats": 8, "curve": "linear", "song2_beat": 31.0}
+    Omitted fields are planned as /api/mix_songs would. With "preview": true
+    only ~20s either side of the fade is rendered, and the session's saved
+    mix is left as it is.
+    """
+    workspace = request_workspace()
+    if workspace is None:
+        return jsonify({"message": "Unknown or expired session"}), 404
+
+    body = request.get_json(silent=True) or {}
+    curve = body.get("curve", "ease_in_out")
+    if curve not in FADE_CURVES:
+        return jsonify({"message": f"Unknown curve '{curve}'; use one of {', '.join(FADE_CURVES)}"}), 400
+    try:
+        transition_point = body.get("transition_point")
+        transition_point = float(transition_point) if transition_point is not None else None
+        song2_beat = body.get("song2_beat")
+        song2_beat = float(song2_beat) if song2_beat is not None else None
+        fade_beats = float(body.get("fade_beats", FADE_BEATS))
+    except (TypeError, ValueError):
+        return jsonify({"message": "transition_point, fade_beats and song2_beat must be numbers"}), 400
+
+    preview = bool(body.get("preview", False))
+
+    try:
+        analysis = analyze_workspace(workspace)
+    except WorkspaceBudgetError as e:
+        return jsonify({"message": str(e)}), 413
+    except Exception as e:
+        logging.info(f"Analysis failed: {str(e)}")
+        return jsonify({"message": "Unable to analyze songs"}), 500
+
+    # Checked against the analysis so bad overrides get a 400, not a failed render
+    if not (math.isfinite(fade_beats) and fade_beats > 0):
+        return jsonify({"message": "fade_beats must be a positive number"}), 400
+    fade_seconds = fade_ms(analysis["tempo1"], fade_beats) / 1000
+    if transition_point is not None and not (0 <= transition_point < analysis["duration1"]):
+        return jsonify({"message": f"transition_point must be between 0 and {analysis['duration1']:.1f}s"}), 400
+    if song2_beat is not None and not (0 <= song2_beat <= analysis["duration2"] - fade_seconds):
+        return jsonify({"message": f"song2_beat must be between 0 and {analysis['duration2'] - fade_seconds:.1f}s "
+                                   f"so the fade fits in song 2"}), 400
+
+    try:
+        mixed_song, mix_info = render_workspace(workspace, transition_point, fade_beats, curve, song2_beat, preview)
+    except WorkspaceBudgetError as e:
+        return jsonify({"message": str(e)}), 413
+    except Exception as e:
+        logging.info(f"Render failed: {str(e)}")
+        return jsonify({"message": "Unable to render mix"}), 500
+
+    if preview:
+        stream = stream_mp3(mixed_song)
+        filename = "preview.mp3"
+    else:
+        stream = stream_mp3(mixed_song, persist_path=workspace.file("mixed_song.mp3"),
+                            on_complete=lambda: workspace.save_result(mix_info))
+        filename = "mixed_song.mp3"
+
+    response = Response(
+        stream_with_context(stream),
+        mimetype="audio/mpeg",
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Mix-Plan": json.dumps(mix_info["plan"])},
+    )
+    response.call_on_close(lambda: release_mix(mixed_song))
+    return response
+
+@app.route('/api/mix_playlist', methods=['POST'])
+def mix_playlist_route():
+    files = request.files.getlist("files")
+    if len(files) < 2 or not all(f and f.filename.endswith(".mp3") for f in files):
+        return jsonify({"message": "Upload at least two MP3 files as 'files'"}), 400
+
+    workspace = Workspace.create()
+    try:
+        paths = [workspace.save_upload(f, f"track_{i:03d}.mp3") for i, f in enumerate(files)]
+        stream, summary = mix_playlist(paths, persist_path=workspace.file("mixed_song.mp3"))
+    except WorkspaceBudgetError as e:
+        workspace.cleanup()
+        return jsonify({"message": str(e)}), 413
+    except Exception as e:
+        logging.info(f"Playlist mix failed: {str(e)}")
+        workspace.cleanup()
+        return jsonify({"message": "Unable to mix playlist"}), 500
+
+    summary["tracks"] = [os.path.basename(f.filename) for f in files]
+    workspace.save_result(summary)
+    return Response(
+        stream_with_context(stream),
+        mimetype="audio/mpeg",
+        headers={"Content-Disposition": "attachment; filename=playlist_mix.mp3", "X-Session-Id": workspace.id},
+    )
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_mix_job():
+    workspace = request_workspace()
+    if workspace is None:
+        return jsonify({"message": "Unknown or expired session"}), 404
+
+    try:
+        job_id = mix_jobs.submit(mix_job, workspace.id)
+    except QueueFullError as e:
+        return jsonify({"message": str(e)}), 503
+
+    return jsonify({"job_id": job_id, "session_id": workspace.id}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def mix_job_status(job_id):
+    status = mix_jobs.status(job_id)
+    if status is None:
+        return jsonify({"message": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def mix_job_result(job_id):
+    status = mix_jobs.status(job_id)
+    if status is None:
+        return jsonify({"message": "Unknown job"}), 404
+    if status["state"] == "failed":
+        return jsonify(status), 500
+    if status["state"] != "done":
+        return jsonify(status), 409
+
+    workspace = Workspace.open(mix_jobs.result(job_id)["workspace_id"])
+    if workspace is None:
+        return jsonify({"message": "Job output has expired"}), 410
+    return send_file(workspace.file("mixed_song.mp3"), mimetype="audio/mpeg", as_attachment=True)
 
 @app.route("/api/upload", methods=["POST"])
 def upload_files():
     file1 = request.files["file1"]
     file2 = request.files["file2"]
     if file1 and file1.filename.endswith(".mp3") and file2 and file2.filename.endswith(".mp3"):
-        song1_path = os.path.join(UPLOAD_FOLDER, "song1.mp3")
-        song2_path = os.path.join(UPLOAD_FOLDER, "song2.mp3")
-        file1.save(song1_path)
-        file2.save(song2_path)
-
-        song_paths["file1"] = song1_path
-        song_paths["file2"] = song2_path
+        # Every upload gets its own workspace so concurrent mixes never share files
+        workspace = Workspace.create()
+        try:
+            workspace.save_upload(file1, "song1.mp3")
+            workspace.save_upload(file2, "song2.mp3")
+        except WorkspaceBudgetError as e:
+            workspace.cleanup()
+            return jsonify({"message": str(e)}), 413
 
         result = f"Files '{file1.filename}' and '{file2.filename}' uploaded successfully!"
 
-        return jsonify({"message": result})
+        return jsonify({"message": result, "session_id": workspace.id})
 
     return jsonify({"message": "Invalid file format. Only MP3 allowed."}), 400
 
 @app.route('/api/save_to_db', methods=["POST"])
 def save_to_db():
+    workspace = request_workspace()
+    mix_info = workspace.load_result() if workspace else None
+    if mix_info is None:
+        return jsonify({"message": "No finished mix for this session"}), 404
+
+    # Ai_DJ_DB connects to MongoDB on import, so it is only imported where
+    # used; spawned workers re-importing this module never pay for it
+    from Ai_DJ_DB import save_audio_to_mongodb
     file1 = request.files["file1"]
     file2 = request.files["file2"]
     logging.info("Saving song to mongoDB ")
@@ -78,20 +290,21 @@ def save_to_db():
 
     song_metadata = {
             "original_songs": [os.path.basename(file1.filename), os.path.basename(file2.filename)],
-            "tempo1": float(tempo["file1"][0]) if isinstance(tempo["file1"], np.ndarray) else float(tempo["file1"]),
-            "tempo2": float(tempo["file2"][0]) if isinstance(tempo["file2"], np.ndarray) else float(tempo["file2"]),
-            "key1": int(key["file1"]),
-            "key2": int(key["file2"]),
+            "tempo1": float(mix_info["tempo1"]),
+            "tempo2": float(mix_info["tempo2"]),
+            "key1": int(mix_info["key1"]),
+            "key2": int(mix_info["key2"]),
             "playlist_name": "Remixes",
-            "transition_point": float(transition_point)
+            "transition_point": float(mix_info["transition_point"])
         }
-    if(save_audio_to_mongodb("temp/mixed_song.mp3", song_name, song_metadata) != None):
+    if(save_audio_to_mongodb(workspace.file("mixed_song.mp3"), song_name, song_metadata) != None):
         return jsonify({"message": "Song sucessfully saved"})
     else:
         return jsonify({"message": "Unable to save song"}), 400
     
 @app.route('/api/list_songs/<playlist>', methods=['GET'])
 def list_songs(playlist):
+    from Ai_DJ_DB import list_stored_files
     logging.info("Getting list from mongoDB ")
     songs = list_stored_files()
     playlist = [entry for entry in songs if entry["playlist_name"] == playlist]
@@ -100,12 +313,15 @@ def list_songs(playlist):
 
 @app.route('/api/get_song_db/<filename>', methods=['GET'])
 def get_song_db(filename):
+    from Ai_DJ_DB import retrieve_audio_from_mongodb
     logging.info("Getting songs from mongoDB ")
-    retrieve_audio_from_mongodb(filename,"temp/retrieved_mixed_output.mp3")
-    return send_from_directory("temp", "retrieved_mixed_output.mp3", as_attachment=False)
+    workspace = Workspace.create()
+    retrieve_audio_from_mongodb(filename, workspace.file("retrieved_mixed_output.mp3"))
+    return send_from_directory(workspace.path, "retrieved_mixed_output.mp3", as_attachment=False)
 
 @app.route('/api/delete_song_db/<filename>', methods=['GET'])
 def delete_song_db(filename):
+    from Ai_DJ_DB import delete_song
     logging.info("Deleting song from mongoDB ")
     if(delete_song(filename)):
         return jsonify({"message": "Song sucessfully deleted"})
@@ -115,6 +331,7 @@ def delete_song_db(filename):
 
 @app.route('/api/move_song/<filename>/<playlist_name>', methods=['GET'])
 def move_song(filename,playlist_name):
+    from Ai_DJ_DB import update_playlist
     logging.info("Moving song to different playlist from mongoDB ")
     if(update_playlist(filename,playlist_name)):
         return jsonify({"message": "Song sucessfully moved"})
@@ -132,6 +349,34 @@ def random_song():
         "song_2": f"/test_songs/{song2}"
     })
 
+@app.route('/api/recommend', methods=['POST'])
+def recommend():
+    body = request.get_json(silent=True) or {}
+    seeds = body.get("seeds", [])
+    try:
+        k = int(body.get("k", ml_model.n_neighbors))
+    except (TypeError, ValueError):
+        return jsonify({"message": "k must be a positive integer"}), 400
+    if k < 1:
+        return jsonify({"message": "k must be a positive integer"}), 400
+    return jsonify(ml_model.recommend_batch(seeds, k))
+
+@app.route('/api/order_set', methods=['POST'])
+def order_set():
+    body = request.get_json(silent=True) or {}
+    tracks, cost = ml_model.order_set(body.get("tracks"), body.get("start"))
+    return jsonify({"tracks": tracks, "cost": cost})
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    # Counters are per process; background jobs keep their own
+    return jsonify({
+        "decoded": decoded_store.stats(),
+        "analysis": analysis_cache.stats(),
+        "lyrics": lyrics_cache.stats(),
+        "stretch": stretch_cache.stats(),
+    })
+
 @app.route('/test_songs/<path:filename>')
 def serve_test_songs(filename):
     try:
@@ -140,152 +385,14 @@ def serve_test_songs(filename):
         return jsonify({"error": "File not found"}), 404
 
 
-def main(file_path1, file_path2):
-    global transition_point
+def main(workspace):
     try:
-        os.makedirs("temp", exist_ok=True)
-        os.makedirs("test_songs", exist_ok=True)
-
-        song1_wav = os.path.join("temp", "song1.wav")
-        song2_wav = os.path.join("temp", "song2.wav")
-
-        #print("\n=== Converting to WAV ===")
-        t1, _ = threaded_run(convert_to_wav, file_path1, song1_wav)
-        t2, _ = threaded_run(convert_to_wav, file_path2, song2_wav)
-        t1.join(); t2.join()
-
-        #print("\n=== Analyzing Songs in Parallel ===")
-        t3, r3 = threaded_run(analyze_audio, song1_wav)
-        t4, r4 = threaded_run(analyze_audio, song2_wav)
-        t3.join(); t4.join()
-
-        tempo["file1"], beats1, y1, sr1, key["file1"], energy1, energy_times1 = r3["value"]
-        tempo["file2"], beats2, y2, sr2, key["file2"], energy2, energy_times2 = r4["value"]
-
-        tempo1 = float(tempo["file1"][0] if isinstance(tempo["file1"], np.ndarray) else tempo["file1"])
-        tempo2 = float(tempo["file2"][0] if isinstance(tempo["file2"], np.ndarray) else tempo["file2"])
-
-        #print("\n=== Adjusting Tempo ===")
-        adjusted_tempo2 = tempo1
-        tempo_adjusted_path = os.path.join("temp", "tempo_adjusted.wav")
-        create_tempo_adjusted_version(song2_wav, tempo_adjusted_path, tempo2, adjusted_tempo2)
-        song2_adjusted = AudioSegment.from_file(tempo_adjusted_path)
-
-        #print("\n=== Analyzing Lyrics in Parallel ===")
-        t5, r5 = threaded_run(get_lyrics_with_cache, song1_wav)
-        t6, r6 = threaded_run(get_lyrics_with_cache, tempo_adjusted_path)
-        t5.join(); t6.join()
-        lyrics1 = r5["value"]
-        lyrics2 = r6["value"]
-
-        lines1 = group_lyrics_into_lines(lyrics1)
-        lines2 = group_lyrics_into_lines(lyrics2)
-
-        bar_duration = 4 * (60 / tempo1)
-        phrase_starts1 = find_phrase_starts(lines1, bar_duration)
-
-        duration1 = len(y1) / sr1
-        duration2 = len(song2_adjusted) / 1000
-
-        non_lyric1 = find_non_lyric_intervals(lines1, duration1)
-        non_lyric2 = find_non_lyric_intervals(lines2, duration2)
-
-        #print("\n=== Finding Transition ===")
-        beats_after_intro = filter_non_intro_beats(beats1)
-        phrase_beats = [b for b in beats_after_intro if any(abs(b - p) < 0.5 for p in phrase_starts1)]
-
-        fade_duration = None
-        transition_point = None
-
-        if phrase_beats:
-            #print(f"Trying {len(phrase_beats)} phrase-aligned beats...")
-            fade_duration, transition_point = find_best_fade_window(phrase_beats, non_lyric1, tempo1, energy1, energy_times1)
-
-        if transition_point is None:
-            # Fallback to end of Song 1
-            fade_duration = MIN_FADE_DURATION
-            transition_point = (len(y1) / sr1) - (fade_duration / 1000)
-
-            # Ensure transition point is not negative
-            if transition_point < MIN_FADE_DURATION / 2000:  # e.g. 2.5s for 5s fade
-                transition_point = MIN_FADE_DURATION / 2000
-
-        if transition_point and bar_duration:
-            transition_point = round(transition_point / bar_duration) * bar_duration
-        #print(f"Quantized transition point to nearest bar: {transition_point:.2f}s")
-
-        fade_beats = 16  # or 12 for a 3-bar fade
-        beat_duration = 60 / tempo1
-        fade_duration = int(fade_beats * beat_duration * 1000)
-        fade_duration = max(MIN_FADE_DURATION, min(MAX_FADE_DURATION, fade_duration))
-
-        beats_fade = fade_duration / 1000 * tempo1 / 60
-        #print(f"Auto-selected: {fade_duration/1000:.1f}s fade (~{beats_fade:.1f} beats)")
-
-        song1 = AudioSegment.from_file(song1_wav)
-        required_duration = fade_duration / 1000
-        current_duration = next((end - start for start, end in non_lyric1 if start <= transition_point <= end), 0)
-
-        if current_duration < required_duration:
-            interval_start = max(0, transition_point - current_duration / 2)
-            interval_end = min(duration1, transition_point + current_duration / 2)
-
-            # Fallback if the loop is too short
-            if interval_end - interval_start < 1:
-                interval_start = max(0, transition_point - 1)
-                interval_end = transition_point
-
-            if interval_end - interval_start <= 0:
-                song1_extended = song1
-            else:
-                song1_extended, transition_point = extend_with_loop(
-                    song1,
-                    interval_start,
-                    interval_end,
-                    required_duration
-                )
-        else:
-            song1_extended = song1
-
-        safe_beats2 = get_safe_transition_points(filter_non_intro_beats(beats2), non_lyric2, fade_duration / 1000)
-        target_beat = transition_point * tempo2 / tempo1
-
-        if not safe_beats2:
-            #print("No safe transition points found in song 2 — falling back to 4-bar entry")
-            song2_beat = beats2[16] if len(beats2) > 16 else 0
-        else:
-            bar_aligned_beats = [b for b in safe_beats2 if abs(b % bar_duration) < 0.3]
-            song2_beat = min(bar_aligned_beats or safe_beats2, key=lambda x: abs(x - target_beat))
-
-        #print(f"Matching beat in Song 2: {song2_beat:.2f}s (target: {target_beat:.2f}s)")
-
-        song2_beat = max(0, song2_beat - 32 * (60 / tempo1))
-        #print(f"Adjusted Song 2 entry earlier: {song2_beat:.2f}s")
-
-        #print("\n=== Mixing Songs ===")
-        mixed_song = dynamic_crossfade(
-            song1_extended,
-            song2_adjusted,
-            transition_point,
-            fade_duration,
-            os.path.basename(file_path1),
-            os.path.basename(file_path2),
-            song2_beat
-        )
-
-        output_path = os.path.join("temp", "mixed_song.mp3")
-        mixed_song.export(output_path, format="mp3")
-        #print(f"\nMixed song saved to: {output_path}")
-        #print(f"Total duration: {len(mixed_song)/1000:.1f} seconds")
-        return output_path
+        return mix_workspace(workspace)
 
     except Exception as e:
         #print(f"\nError: {str(e)}")
         return None
-    finally:
-        for temp_file in ["temp/song1.wav", "temp/song2.wav", "temp/tempo_adjusted.wav"]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
 
 if __name__ == "__main__":
+    init_server()
     app.run(debug=True, use_reloader=False)
@@ -0,0 +1,117 @@
+import os
+import struct
+import tempfile
+import numpy as np
+from audio_cache import CACHE_ROOT, NpzCache
+
+# Raw PCM file: a small header, then (frames, channels) samples, so a
+# track can be memory-mapped straight into a NumPy array. The OS page
+# cache decides what stays in RAM; every reader shares the same pages.
+PCM_MAGIC = b"GPCM"
+PCM_VERSION = 1
+PCM_HEADER = struct.Struct("<4sHHIIQ")  # magic, version, dtype code, channels, sample rate, frames
+PCM_DATA_OFFSET = 64  # samples start here, past the padded header
+# Only float32 so far; DecodedTrack expects samples already in [-1, 1]
+PCM_DTYPES = {1: np.dtype("<f4")}
+PCM_DTYPE_CODES = {dtype: code for code, dtype in PCM_DTYPES.items()}
+PCM_DTYPE = PCM_DTYPES[1]
+
+def _header(samples, sr):
+    code = PCM_DTYPE_CODES[samples.dtype]
+    header = PCM_HEADER.pack(PCM_MAGIC, PCM_VERSION, code, samples.shape[1], int(sr), samples.shape[0])
+    return header.ljust(PCM_DATA_OFFSET, b"\0")
+
+def _as_pcm(samples):
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    return np.ascontiguousarray(samples, dtype=PCM_DTYPE)
+
+def write_pcm(path, samples, sr):
+    """Writes samples (frames[, channels]) as a PCM file, renamed into place once complete."""
+    samples = _as_pcm(samples)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_header(samples, sr))
+            f.write(samples.data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def read_pcm(path):
+    """(read-only memory-mapped samples of shape (frames, channels), sample rate) for a PCM file."""
+    with open(path, "rb") as f:
+        header = f.read(PCM_HEADER.size)
+    if len(header) < PCM_HEADER.size:
+        raise ValueError(f"{path} is not a PCM file")
+    magic, version, code, channels, sr, frames = PCM_HEADER.unpack(header)
+    if magic != PCM_MAGIC or version != PCM_VERSION or code not in PCM_DTYPES:
+        raise ValueError(f"{path} is not a version {PCM_VERSION} PCM file")
+    if frames == 0:
+        return np.empty((0, channels), dtype=PCM_DTYPES[code]), sr
+    samples = np.memmap(path, dtype=PCM_DTYPES[code], mode="r", offset=PCM_DATA_OFFSET, shape=(frames, channels))
+    return samples, sr
+
+def allocate_pcm(path, shape, sr):
+    """
+    A new writable, memory-mapped PCM file of the given (frames, channels)
+    shape, e.g. for a mix output that shouldn't live in RAM. It replaces any
+    previous file at path; readers still mapping that one are unaffected.
+    """
+    frames, channels = shape
+    dtype = PCM_DTYPE
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            header = PCM_HEADER.pack(PCM_MAGIC, PCM_VERSION, PCM_DTYPE_CODES[dtype], channels, int(sr), frames)
+            f.write(header.ljust(PCM_DATA_OFFSET, b"\0"))
+            f.truncate(PCM_DATA_OFFSET + frames * channels * dtype.itemsize)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if frames == 0:
+        return np.empty((0, channels), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r+", offset=PCM_DATA_OFFSET, shape=(frames, channels))
+
+class PcmStore(NpzCache):
+    """
+    Size-bounded cache of PCM files, with NpzCache's atomic writes, LRU
+    eviction and hit counting. get() and put() return memory-mapped
+    (samples, sr), so hits cost no decoding and no copy.
+    """
+    SUFFIX = ".pcm"
+
+    def __init__(self, name, max_bytes=1024 * 1024 * 1024, root=CACHE_ROOT):
+        super().__init__(name, max_bytes, root)
+
+    def path(self, key):
+        return self._path(key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            cached = read_pcm(path)
+            # Bump mtime so eviction treats this entry as recently used
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return cached
+
+    def put(self, key, samples, sr):
+        path = write_pcm(self._path(key), samples, sr)
+        self.evict()
+        try:
+            return read_pcm(path)
+        except FileNotFoundError:
+            # Evicted straight away (larger than the whole budget)
+            return _as_pcm(samples), int(sr)
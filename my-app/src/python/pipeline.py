@@ -0,0 +1,543 @@
+from audiomix import *
+from decode import decode_audio, save_track, load_track
+from encode import export_mp3
+from workspace import Workspace, WorkspaceBudgetError
+from executor import run_in_thread
+import numpy as np
+import os
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# Kept free of Flask/MongoDB setup so worker processes can import it cheaply
+
+MIN_INTRO_DURATION = 30
+MIN_FADE_DURATION = 5000
+MAX_FADE_DURATION = 30000
+FADE_BEATS = 16  # or 12 for a 3-bar fade
+
+ANALYSIS_FILE = "analysis.json"
+ANALYSIS_FILE_VERSION = 2  # bumped when a field's meaning changes; older files are recomputed
+# Array fields of a pair analysis and the dtypes they are restored with
+ANALYSIS_ARRAYS = {"beats1": np.float64, "beats2": np.float64, "energy1": np.float32, "energy_times1": np.float64,
+                   "sections1": np.float64, "sections2": np.float64}
+
+# Seconds of song 1 before the fade and of song 2 after it in a preview
+PREVIEW_BEFORE = 20
+PREVIEW_AFTER = 20
+
+# Past the fade, ease song 2 back to its own tempo instead of stretching it all
+STRETCH_RAMP = os.getenv("STRETCH_RAMP", "0") == "1"
+
+# Decoded inputs, kept for re-renders
+SONG1_PCM = "song1.pcm"
+SONG2_PCM = "song2.pcm"
+MIXED_PCM = "mixed.pcm"
+
+CANDIDATE_WEIGHTS = {"energy": 1.0, "lyric_free": 2.0, "phrase": 1.0, "bar": 1.0, "section": 1.0}
+
+def plan_transition(tempo1, beats1, energy1, energy_times1, lines1, duration1,
+                    tempo2, beats2, lines2, duration2, min_time=MIN_INTRO_DURATION, fade_beats=FADE_BEATS,
+                    sections1=(), song2_beat=None):
+    """
+    Chooses where and how song 1 hands over to song 2, from analysis alone.
+    Beats near phrase starts or song 1's section boundaries are considered.
+    Returns a plan dict: transition_point (s, in song 1), fade_duration (ms),
+    loop (song 1 interval to repeat so the fade fits, or None) and
+    song2_beat (s, entry point in the tempo-adjusted song 2; chosen unless given).
+    """
+    bar_duration = 4 * (60 / tempo1)
+    # Section boundaries also give instrumental tracks candidates
+    phrase_starts1 = find_phrase_starts(lines1, bar_duration) + [float(t) for t in sections1]
+
+    non_lyric1 = find_non_lyric_intervals(lines1, duration1)
+
+    #print("\n=== Finding Transition ===")
+    beats_after_intro = [beat for beat in beats1 if beat >= min_time]
+    phrase_beats = beats_near(beats_after_intro, phrase_starts1, 0.5)
+
+    fade_duration = None
+    transition_point = None
+
+    if phrase_beats:
+        #print(f"Trying {len(phrase_beats)} phrase-aligned beats...")
+        fade_duration, transition_point = find_best_fade_window(phrase_beats, non_lyric1, tempo1, energy1, energy_times1)
+
+    if transition_point is None:
+        # Fallback to end of Song 1
+        fade_duration = MIN_FADE_DURATION
+        transition_point = duration1 - (fade_duration / 1000)
+
+        # Ensure transition point is not negative
+        if transition_point < MIN_FADE_DURATION / 2000:  # e.g. 2.5s for 5s fade
+            transition_point = MIN_FADE_DURATION / 2000
+
+    if transition_point and bar_duration:
+        transition_point = round(transition_point / bar_duration) * bar_duration
+    #print(f"Quantized transition point to nearest bar: {transition_point:.2f}s")
+
+    return plan_at(transition_point, tempo1, lines1, duration1, tempo2, beats2, lines2, duration2, fade_beats,
+                   song2_beat)
+
+def fade_ms(tempo, fade_beats=FADE_BEATS):
+    fade_duration = int(fade_beats * (60 / tempo) * 1000)
+    return max(MIN_FADE_DURATION, min(MAX_FADE_DURATION, fade_duration))
+
+def plan_at(transition_point, tempo1, lines1, duration1, tempo2, beats2, lines2, duration2,
+            fade_beats=FADE_BEATS, song2_beat=None):
+    """
+    The rest of a plan for a given transition point: fade length, the loop
+    that makes the fade fit, and song 2's entry beat (chosen unless given).
+    """
+    bar_duration = 4 * (60 / tempo1)
+    non_lyric1 = find_non_lyric_intervals(lines1, duration1)
+
+    fade_duration = fade_ms(tempo1, fade_beats)
+
+    beats_fade = fade_duration / 1000 * tempo1 / 60
+    #print(f"Auto-selected: {fade_duration/1000:.1f}s fade (~{beats_fade:.1f} beats)")
+
+    loop = None
+    required_duration = fade_duration / 1000
+    current_duration = next((end - start for start, end in non_lyric1 if start <= transition_point <= end), 0)
+
+    if current_duration < required_duration:
+        interval_start = max(0, transition_point - current_duration / 2)
+        interval_end = min(duration1, transition_point + current_duration / 2)
+
+        # Fallback if the loop is too short
+        if interval_end - interval_start < 1:
+            interval_start = max(0, transition_point - 1)
+            interval_end = transition_point
+
+        if interval_end - interval_start > 0:
+            # extend_with_loop moves the transition to the end of the first loop pass
+            loop = (interval_start, interval_end)
+            transition_point = interval_end
+
+    if song2_beat is None:
+        non_lyric2 = find_non_lyric_intervals(lines2, duration2)
+        safe_beats2 = get_safe_transition_points(filter_non_intro_beats(beats2), non_lyric2, fade_duration / 1000)
+        target_beat = transition_point * tempo2 / tempo1
+
+        if not safe_beats2:
+            #print("No safe transition points found in song 2 — falling back to 4-bar entry")
+            song2_beat = beats2[16] if len(beats2) > 16 else 0
+        else:
+            bar_aligned_beats = [b for b in safe_beats2 if abs(b % bar_duration) < 0.3]
+            song2_beat = min(bar_aligned_beats or safe_beats2, key=lambda x: abs(x - target_beat))
+
+        #print(f"Matching beat in Song 2: {song2_beat:.2f}s (target: {target_beat:.2f}s)")
+
+        song2_beat = max(0, song2_beat - 32 * (60 / tempo1))
+        #print(f"Adjusted Song 2 entry earlier: {song2_beat:.2f}s")
+
+    return {
+        "transition_point": float(transition_point),
+        "fade_duration": int(fade_duration),
+        "loop": [float(loop[0]), float(loop[1])] if loop else None,
+        "song2_beat": float(song2_beat),
+    }
+
+def render_transition(song1, song2_adjusted, plan, song1_name="Song 1", song2_name="Song 2", curve_type="ease_in_out",
+                      out_path=None):
+    """
+    Applies a plan from plan_transition to the decoded audio, mixing into a
+    memory-mapped PCM file at out_path if given.
+    """
+    if plan["loop"]:
+        song1, _ = extend_with_loop(song1, plan["loop"][0], plan["loop"][1], plan["fade_duration"] / 1000)
+    return dynamic_crossfade(
+        song1,
+        song2_adjusted,
+        plan["transition_point"],
+        plan["fade_duration"],
+        song1_name,
+        song2_name,
+        plan["song2_beat"],
+        curve_type,
+        out_path,
+    )
+
+def stretch_for_plan(track2, rate, plan, duration=None, ramp=STRETCH_RAMP):
+    """
+    Song 2 stretched only from the plan's entry beat on, since nothing before
+    it is heard, and the plan with song2_beat moved onto that region's
+    timeline. duration (s of output) limits the region further, e.g. for a
+    preview; ramp eases back to song 2's own tempo once the fade is over.
+    """
+    start = plan["song2_beat"] * rate
+    end = None if duration is None else start + duration * rate
+    hold = plan["fade_duration"] / 1000 if ramp else None
+    region = stretch_track(track2, rate, start, end, hold)
+    return region, {**plan, "song2_beat": 0.0}
+
+def render_preview(song1, song2_adjusted, plan, song1_name="Song 1", song2_name="Song 2", curve_type="ease_in_out",
+                   before=PREVIEW_BEFORE, after=PREVIEW_AFTER):
+    """
+    Just the transition of the mix render_transition would produce: `before`
+    seconds of song 1, the crossfade, then `after` seconds of song 2. Both
+    tracks are cropped first, so looping, resampling and the output buffer
+    only cover the window.
+    """
+    fade = plan["fade_duration"] / 1000
+    loop = plan["loop"]
+    transition_point = plan["transition_point"]
+
+    # Song 1 from `before` ahead of the fade (or loop) up to the transition
+    sr = song1.sr
+    first = min(transition_point - fade, loop[0] if loop else transition_point) - before
+    start = max(0, int(first * sr))
+    end = min(song1.frames, int(max(transition_point, loop[1] if loop else 0) * sr) + sr)
+    offset = start / sr
+    window1 = DecodedTrack(song1.samples[start:end], sr, song1.name)
+    if loop:
+        window1, _ = extend_with_loop(window1, loop[0] - offset, loop[1] - offset, fade)
+
+    # Song 2 from its entry to `after` past the fade
+    sr2 = song2_adjusted.sr
+    entry = int(plan["song2_beat"] * sr2)
+    window2 = DecodedTrack(song2_adjusted.samples[entry:entry + int((fade + after + 1) * sr2)], sr2, song2_adjusted.name)
+    window2 = window2.resampled(sr)
+
+    bounds = crossfade_bounds(window1, window2, transition_point - offset, plan["fade_duration"],
+                              song1_name, song2_name, 0.0)
+    out_start, out_end, in_start, in_end = bounds
+    lead_start = max(0, out_start - int(before * sr))
+    tail = window2.samples[in_end:in_end + int(after * sr)]
+
+    lead_len = out_start - lead_start
+    fade_len = out_end - out_start
+    preview = np.empty((lead_len + fade_len + len(tail), max(window1.channels, window2.channels)), dtype=np.float32)
+    preview[:lead_len] = window1.samples[lead_start:out_start]
+    render_crossfade(window1, window2, bounds, curve_type, out=preview[lead_len:lead_len + fade_len])
+    preview[lead_len + fade_len:] = tail
+    return DecodedTrack(preview, sr, f"{song1_name} x {song2_name} (preview)")
+
+def analyze_pair(track1, track2, progress=None):
+    """
+    Everything plan_transition needs for a pair of DecodedTracks, with song 2's
+    beats, sections, lyrics and duration mapped onto its tempo-adjusted timeline. Nothing is
+    stretched yet: that waits until the plan says which part of song 2 is used.
+    """
+    report = progress or (lambda stage, fraction: None)
+
+    report("analyzing", 0.1)
+    #print("\n=== Analyzing Lyrics in Parallel ===")
+    # Song 2 is transcribed from the original audio alongside analysis; the
+    # stretch rate is constant so its timings are remapped after
+    lyrics_future1 = run_in_thread(get_lyrics_with_cache, track1)
+    lyrics_future2 = run_in_thread(get_lyrics_with_cache, track2)
+
+    #print("\n=== Analyzing Songs in Parallel ===")
+    # Separate processes, so librosa's GIL-bound beat tracking really runs in parallel
+    analysis1, analysis2 = analyze_tracks([track1, track2])
+
+    tempo1, tempo2 = analysis1.tempo, analysis2.tempo
+
+    #print("\n=== Adjusting Tempo ===")
+    adjusted_tempo2 = tempo1
+    stretch_rate = get_stretch_rate(tempo2, adjusted_tempo2)
+    duration2 = track2.duration / stretch_rate
+
+    report("transcribing", 0.5)
+    lyrics1 = lyrics_future1.result()
+    lyrics2 = remap_lyric_timings(lyrics_future2.result(), stretch_rate)
+
+    analysis = {
+        "tempo1": tempo1,
+        "tempo2": tempo2,
+        "key1": analysis1.key,
+        "key2": analysis2.key,
+        "stretch_rate": stretch_rate,
+        "beats1": analysis1.beats,
+        "beats2": analysis2.beats / stretch_rate,
+        "energy1": analysis1.energy,
+        "energy_times1": analysis1.energy_times,
+        "sections1": analysis1.sections,
+        "sections2": analysis2.sections / stretch_rate,
+        "lines1": group_lyrics_into_lines(lyrics1),
+        "lines2": group_lyrics_into_lines(lyrics2),
+        "duration1": track1.duration,
+        "duration2": duration2,
+        "sr1": track1.sr,
+        "sr2": track2.sr,
+    }
+    return analysis
+
+def save_analysis(workspace, analysis):
+    workspace.save_json(ANALYSIS_FILE, {
+        "version": ANALYSIS_FILE_VERSION,
+        **{key: value.tolist() if key in ANALYSIS_ARRAYS else value for key, value in analysis.items()},
+    })
+
+def load_analysis(workspace):
+    """The workspace's saved pair analysis, or None if it hasn't been analyzed (or was saved by an older version)."""
+    analysis = workspace.load_json(ANALYSIS_FILE)
+    if analysis is None or analysis.pop("version", None) != ANALYSIS_FILE_VERSION:
+        return None
+    for key, dtype in ANALYSIS_ARRAYS.items():
+        analysis[key] = np.asarray(analysis.get(key, ()), dtype=dtype)
+    return analysis
+
+def analyze_workspace(workspace, progress=None):
+    """A workspace's pair analysis, computed and saved on first use."""
+    analysis = load_analysis(workspace)
+    if analysis is None:
+        track1, track2 = decode_pair(workspace.file("song1.mp3"), workspace.file("song2.mp3"), progress, workspace)
+        analysis = analyze_pair(track1, track2, progress)
+        save_analysis(workspace, analysis)
+        # Saved too, so the first render doesn't decode again
+        save_render_tracks(workspace, track1, track2)
+    return analysis
+
+def plan_for_analysis(analysis, transition_point=None, fade_beats=FADE_BEATS, song2_beat=None):
+    """plan_transition for a pair analysis, or plan_at when the transition point is given."""
+    a = analysis
+    if transition_point is None:
+        return plan_transition(a["tempo1"], a["beats1"], a["energy1"], a["energy_times1"], a["lines1"], a["duration1"],
+                               a["tempo2"], a["beats2"], a["lines2"], a["duration2"], fade_beats=fade_beats,
+                               sections1=a["sections1"], song2_beat=song2_beat)
+    return plan_at(transition_point, a["tempo1"], a["lines1"], a["duration1"],
+                   a["tempo2"], a["beats2"], a["lines2"], a["duration2"], fade_beats, song2_beat)
+
+# Transition candidates
+def _distance_to_nearest(beats, points):
+    """Distance from each beat to the nearest of points (inf if there are none)."""
+    points = np.sort(np.asarray(points, dtype=np.float64).reshape(-1))
+    if len(points) == 0:
+        return np.full(len(beats), np.inf)
+    right = np.clip(np.searchsorted(points, beats), 0, len(points) - 1)
+    left = np.maximum(right - 1, 0)
+    return np.minimum(np.abs(beats - points[left]), np.abs(beats - points[right]))
+
+def transition_candidates(analysis, k=5, min_time=MIN_INTRO_DURATION, weights=CANDIDATE_WEIGHTS):
+    """
+    Top-k beats of song 1 to transition on, best first, each at least a bar
+    from any better one. Every beat is scored 0-1 on:
+    - energy: mid-level energy mixes best (as in find_best_fade_window)
+    - lyric_free: share of the fade-out window with no vocals
+    - phrase: closeness to a phrase start, reaching 0 a bar away
+    - bar: closeness to the bar grid plan_transition quantizes to
+    - section: closeness to a section boundary, reaching 0 two bars away
+    Each candidate carries a full plan, so it can be rendered without re-analysis.
+    """
+    tempo1 = analysis["tempo1"]
+    bar_duration = 4 * (60 / tempo1)
+    fade = fade_ms(tempo1) / 1000
+    lines = analysis["lines1"]
+
+    beats = np.asarray(analysis["beats1"], dtype=np.float64)
+    beats = beats[(beats >= max(min_time, fade)) & (beats < analysis["duration1"])]
+    if len(beats) == 0:
+        return []
+
+    energy = analysis["energy1"]
+    energy_score = 1 - np.abs(0.5 - np.interp(beats, analysis["energy_times1"], energy) / np.max(energy))
+
+    # Crossfades fade song 1 out over [point - fade, point]
+    if lines:
+        line_starts = np.array([line["start"] for line in lines])
+        line_ends = np.array([line["end"] for line in lines])
+        sung = np.minimum(beats[:, np.newaxis], line_ends) - np.maximum(beats[:, np.newaxis] - fade, line_starts)
+        lyric_free_score = 1 - np.minimum(1, np.clip(sung, 0, None).sum(axis=1) / fade)
+    else:
+        lyric_free_score = np.ones(len(beats))
+
+    phrase_score = np.clip(1 - _distance_to_nearest(beats, find_phrase_starts(lines, bar_duration)) / bar_duration, 0, 1)
+
+    bar_offset = np.abs(beats - np.round(beats / bar_duration) * bar_duration)
+    bar_score = 1 - 2 * bar_offset / bar_duration
+
+    section_score = np.clip(1 - _distance_to_nearest(beats, analysis["sections1"]) / (2 * bar_duration), 0, 1)
+
+    components = {"energy": energy_score, "lyric_free": lyric_free_score, "phrase": phrase_score, "bar": bar_score,
+                  "section": section_score}
+    total = sum(weights[name] * score for name, score in components.items()) / sum(weights.values())
+
+    chosen = []
+    for i in np.argsort(-total, kind="stable"):
+        if all(abs(beats[i] - beats[j]) >= bar_duration for j in chosen):
+            chosen.append(i)
+            if len(chosen) == k:
+                break
+
+    return [
+        {
+            "transition_point": float(beats[i]),
+            "score": round(float(total[i]), 4),
+            "scores": {name: round(float(score[i]), 4) for name, score in components.items()},
+            "plan": plan_for_analysis(analysis, float(beats[i])),
+        }
+        for i in chosen
+    ]
+
+def decode_pair(file_path1, file_path2, progress=None, workspace=None):
+    """
+    Decodes both inputs in parallel. If a workspace is given, its memory
+    budget is checked once they are decoded.
+    """
+    report = progress or (lambda stage, fraction: None)
+
+    #print("\n=== Decoding ===")
+    report("decoding", 0.0)
+    # Each input is decoded once; every later stage reads the same buffer
+    decode1 = run_in_thread(decode_audio, file_path1)
+    decode2 = run_in_thread(decode_audio, file_path2)
+    track1 = decode1.result()
+    track2 = decode2.result()
+    if workspace is not None:
+        workspace.check_memory_budget(track1, track2)
+    return track1, track2
+
+def mix_tracks(file_path1, file_path2, progress=None, workspace=None):
+    """
+    Runs analysis and the crossfade. Returns the mixed DecodedTrack and a
+    dict of the tempo/key/transition values the mix was built from.
+    progress(stage, fraction) is called as each stage starts. If a workspace
+    is given, its memory budget is checked once the inputs are decoded, the
+    analysis is saved in it for transition_candidates and re-renders, and
+    the mix is written to a memory-mapped PCM file there.
+    """
+    report = progress or (lambda stage, fraction: None)
+
+    track1, track2 = decode_pair(file_path1, file_path2, report, workspace)
+    analysis = analyze_pair(track1, track2, report)
+    if workspace is not None:
+        save_analysis(workspace, analysis)
+        # Written in the background; render_workspace re-mixes from these
+        saved = run_in_thread(save_render_tracks, workspace, track1, track2)
+
+    #print("\n=== Finding Transition ===")
+    report("transition", 0.7)
+    plan = plan_for_analysis(analysis)
+    transition_point = plan["transition_point"]
+
+    #print("\n=== Adjusting Tempo ===")
+    report("stretching", 0.75)
+    track2_adjusted, region_plan = stretch_for_plan(track2, analysis["stretch_rate"], plan)
+
+    #print("\n=== Mixing Songs ===")
+    report("mixing", 0.9)
+    mixed_song = render_transition(
+        track1,
+        track2_adjusted,
+        region_plan,
+        os.path.basename(file_path1),
+        os.path.basename(file_path2),
+        out_path=workspace.file(MIXED_PCM) if workspace is not None else None,
+    )
+
+    mix_info = {
+        "tempo1": analysis["tempo1"],
+        "tempo2": analysis["tempo2"],
+        "key1": analysis["key1"],
+        "key2": analysis["key2"],
+        "transition_point": float(transition_point),
+    }
+    if workspace is not None:
+        # Raises anything the background write raised
+        saved.result()
+    return mixed_song, mix_info
+
+def save_render_tracks(workspace, track1, track2):
+    """
+    Keeps both decoded tracks in the workspace for re-renders. They count
+    towards its disk budget; if they don't fit they are removed again and
+    WorkspaceBudgetError is raised.
+    """
+    save_track(track1, workspace.file(SONG1_PCM))
+    save_track(track2, workspace.file(SONG2_PCM))
+    try:
+        workspace.check_disk_budget()
+    except WorkspaceBudgetError:
+        for name in (SONG1_PCM, SONG2_PCM):
+            if os.path.exists(workspace.file(name)):
+                os.remove(workspace.file(name))
+        raise
+
+def release_mix(mixed_song):
+    """
+    Deletes a mix's memory-mapped PCM file from the workspace once it has
+    been encoded. The mapping itself stays valid until the track is dropped.
+    """
+    if mixed_song.path is None:
+        return
+    try:
+        os.remove(mixed_song.path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # e.g. Windows, which won't delete a mapped file; the next mix replaces it
+        logging.info(f"Could not remove {mixed_song.path}: {e}")
+
+def render_tracks(workspace, analysis, progress=None):
+    """
+    Decoded song 1 and song 2 for a re-render, memory-mapped from the
+    workspace. Decoded again (then saved) only if they are missing.
+    """
+    try:
+        return (load_track(workspace.file(SONG1_PCM), "song1.mp3"),
+                load_track(workspace.file(SONG2_PCM), "song2.mp3"))
+    except (FileNotFoundError, ValueError):
+        pass
+
+    track1, track2 = decode_pair(workspace.file("song1.mp3"), workspace.file("song2.mp3"), progress, workspace)
+    save_render_tracks(workspace, track1, track2)
+    return track1, track2
+
+def render_workspace(workspace, transition_point=None, fade_beats=FADE_BEATS, curve_type="ease_in_out",
+                     song2_beat=None, preview=False, progress=None):
+    """
+    Re-mixes a workspace from its saved analysis and audio, with overrides:
+    transition point (s in song 1; planned as usual if None), fade length in
+    beats, fade curve and song 2's entry (s; chosen as usual if None).
+    Only plans and crossfades; with preview=True only the window around the
+    transition is rendered. Returns the mixed DecodedTrack and mix info.
+    """
+    analysis = analyze_workspace(workspace, progress)
+    song1, song2 = render_tracks(workspace, analysis, progress)
+
+    plan = plan_for_analysis(analysis, transition_point, fade_beats, song2_beat)
+    if preview:
+        # Only the fade and what follows it in the preview are stretched
+        duration = plan["fade_duration"] / 1000 + PREVIEW_AFTER + 1
+        song2_adjusted, region_plan = stretch_for_plan(song2, analysis["stretch_rate"], plan, duration)
+        mixed_song = render_preview(song1, song2_adjusted, region_plan, song1.name, song2.name, curve_type)
+    else:
+        song2_adjusted, region_plan = stretch_for_plan(song2, analysis["stretch_rate"], plan)
+        mixed_song = render_transition(song1, song2_adjusted, region_plan, song1.name, song2.name, curve_type,
+                                       workspace.file(MIXED_PCM))
+
+    mix_info = {
+        "tempo1": analysis["tempo1"],
+        "tempo2": analysis["tempo2"],
+        "key1": analysis["key1"],
+        "key2": analysis["key2"],
+        "transition_point": plan["transition_point"],
+        "plan": plan,
+        "curve": curve_type,
+    }
+    return mixed_song, mix_info
+
+def mix_workspace(workspace, progress=None):
+    """
+    Full mix of a workspace's uploads: analyze, crossfade and encode to
+    mixed_song.mp3 in the workspace, recording the result alongside it.
+    """
+    report = progress or (lambda stage, fraction: None)
+    mixed_song, mix_info = mix_tracks(workspace.file("song1.mp3"), workspace.file("song2.mp3"), report, workspace)
+    report("encoding", 0.95)
+    try:
+        output_path = export_mp3(mixed_song, workspace.file("mixed_song.mp3"))
+    finally:
+        release_mix(mixed_song)
+    workspace.save_result(mix_info)
+    return output_path
+
+def mix_job(workspace_id, progress=None):
+    """Background-job entry point; runs in a worker process."""
+    workspace = Workspace.open(workspace_id)
+    if workspace is None:
+        raise ValueError(f"Workspace {workspace_id} no longer exists")
+    mix_workspace(workspace, progress)
+    return {"workspace_id": workspace_id}
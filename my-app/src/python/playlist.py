@@ -0,0 +1,152 @@
+from audiomix import *
+from pipeline import plan_transition
+from decode import decode_audio
+from encode import stream_mp3_blocks
+from executor import map_processes, run_in_thread
+import numpy as np
+import os
+import logging
+logging.basicConfig(level=logging.INFO)
+
+PLAYLIST_CHANNELS = 2
+
+def analyze_file(file_path):
+    """
+    Everything a playlist plan needs from one track's audio features. Runs
+    in a pool worker and returns features only, so no decoded audio is sent
+    back; lyrics are transcribed in the parent with the shared Whisper model.
+    """
+    track = decode_audio(file_path)
+    analysis = analyze_audio(track)
+    return {
+        "tempo": analysis.tempo,
+        "beats": analysis.beats,
+        "key": analysis.key,
+        "energy": analysis.energy,
+        "energy_times": analysis.energy_times,
+        "sections": analysis.sections,
+        "duration": track.duration,
+        "sr": track.sr,
+    }
+
+def _played_timeline(analysis, rate):
+    """An analysis mapped onto the timeline of the track stretched by rate."""
+    return {
+        "tempo": analysis["tempo"] / rate,
+        "beats": analysis["beats"] / rate,
+        "energy": analysis["energy"],
+        "energy_times": analysis["energy_times"] / rate,
+        "sections": analysis["sections"] / rate,
+        "duration": analysis["duration"] / rate,
+        "lines": group_lyrics_into_lines(remap_lyric_timings(analysis["lyrics"], rate)),
+    }
+
+def plan_playlist(analyses):
+    """
+    Stretch rates and transition plans for an ordered list of analyses.
+    Each track is stretched to the tempo the previous one is played at, and
+    each transition is placed after the previous track's fade-in has ended.
+    """
+    rates = [1.0]
+    played = [_played_timeline(analyses[0], 1.0)]
+    for analysis in analyses[1:]:
+        rate = get_stretch_rate(analysis["tempo"], played[-1]["tempo"])
+        rates.append(rate)
+        played.append(_played_timeline(analysis, rate))
+
+    plans = []
+    min_time = MIN_INTRO_DURATION
+    for current, upcoming, analysis in zip(played, played[1:], analyses[1:]):
+        plan = plan_transition(
+            current["tempo"], current["beats"], current["energy"], current["energy_times"],
+            current["lines"], current["duration"],
+            analysis["tempo"], upcoming["beats"], upcoming["lines"], upcoming["duration"],
+            min_time=min_time,
+            sections1=current["sections"],
+        )
+        plans.append(plan)
+        min_time = plan["song2_beat"] + plan["fade_duration"] / 1000 + MIN_INTRO_DURATION
+    return rates, plans
+
+def render_playlist(file_paths, rates, plans, sr):
+    """
+    Yields the whole set as float32 blocks. Only the track playing and the
+    next one (decoded and stretched ahead in the background) are in memory;
+    each track is dropped once its fade-out has been yielded.
+    """
+    def load(i):
+        """Track i from its entry beat on (nothing earlier is heard), and where that is in s."""
+        track = decode_audio(file_paths[i]).resampled(sr)
+        if i == 0:
+            return track, 0.0
+        entry = plans[i - 1]["song2_beat"]
+        if rates[i] == 1.0:
+            first = int(entry * sr)
+            return DecodedTrack(track.samples[first:], sr, track.name), first / sr
+        return stretch_track(track, rates[i], entry * rates[i]), entry
+
+    current, offset = load(0)  # offset: seconds of current's timeline already yielded
+    upcoming = run_in_thread(load, 1) if len(file_paths) > 1 else None
+
+    for i, plan in enumerate(plans):
+        song2, song2_start = upcoming.result()
+        upcoming = run_in_thread(load, i + 2) if i + 2 < len(file_paths) else None
+
+        # Plans are on each track's full timeline; current starts at offset
+        song1 = current
+        if plan["loop"]:
+            loop_start = max(0.0, plan["loop"][0] - offset)
+            loop_end = plan["loop"][1] - offset
+            if loop_end > loop_start:
+                song1, _ = extend_with_loop(song1, loop_start, loop_end, plan["fade_duration"] / 1000)
+
+        bounds = crossfade_bounds(song1, song2, plan["transition_point"] - offset, plan["fade_duration"],
+                                  song1.name, song2.name, plan["song2_beat"] - song2_start)
+        out_start, out_end, in_start, in_end = bounds
+        yield song1.samples[:out_start]
+        yield render_crossfade(song1, song2, bounds)
+
+        current = DecodedTrack(song2.samples[in_end:], sr, song2.name)
+        offset = song2_start + in_end / sr
+        del song1, song2
+
+    yield current.samples
+
+def mix_playlist(file_paths, persist_path=None, progress=None):
+    """
+    Mixes an ordered list of tracks into one continuous set. Analysis runs
+    up front, one track per pool worker; the returned generator then
+    renders and encodes the set in a single pass.
+    Returns (mp3 byte generator, summary of the stretch rates and plans).
+    """
+    report = progress or (lambda stage, fraction: None)
+    if len(file_paths) < 2:
+        raise ValueError("A playlist mix needs at least two tracks")
+
+    report("decoding", 0.0)
+    # Decoded once here into the decoded store, so the workers' decode_audio
+    # only maps it; lyrics are transcribed alongside analysis on threads
+    tracks = [future.result() for future in [run_in_thread(decode_audio, path) for path in file_paths]]
+    lyrics_futures = [run_in_thread(get_lyrics_with_cache, track) for track in tracks]
+    del tracks
+
+    report("analyzing", 0.1)
+    analyses = map_processes(analyze_file, file_paths)
+    report("transcribing", 0.4)
+    for analysis, lyrics in zip(analyses, lyrics_futures):
+        analysis["lyrics"] = lyrics.result()
+
+    report("transition", 0.5)
+    rates, plans = plan_playlist(analyses)
+    summary = {
+        "tracks": [os.path.basename(path) for path in file_paths],
+        "tempos": [a["tempo"] for a in analyses],
+        "keys": [a["key"] for a in analyses],
+        "stretch_rates": rates,
+        "transitions": plans,
+    }
+
+    report("mixing", 0.6)
+    sr = analyses[0]["sr"]
+    blocks = render_playlist(file_paths, rates, plans, sr)
+    return stream_mp3_blocks(blocks, sr, PLAYLIST_CHANNELS, persist_path), summary
@@ -5,50 +5,85 @@ from sklearn.neighbors import NearestNeighbors
 import numpy as np
 import os, random
 import joblib
+from library_index import LibraryIndex
+from set_order import order_tracks
 
 
 
+FEATURE_KEYS = ('tempo', 'key', 'energy')
+
 class AIDJ:
-    def __init__(self):
+    def __init__(self, n_neighbors=2):
         self.track_features = {}
-        self.nn_model =  NearestNeighbors(n_neighbors=3)
+        # Contiguous feature matrix with a parallel name array; rows line up
+        # with the neighbor index, and name_index maps a name to its row
+        self.names = np.array([], dtype=str)
+        self.features = np.empty((0, len(FEATURE_KEYS)))
+        self.scaled_features = self.features
+        self.name_index = {}
+        self.n_neighbors = n_neighbors
+        # 3 dense features: a k-d tree answers queries in ~log(n)
+        self.nn_model = NearestNeighbors(algorithm="kd_tree")
         self.scaler = StandardScaler()
 
-    
-    def build_music_graph(self):
-        for file in os.listdir("test_songs"):
-            tempo, beats, y, sr, key, energy, energy_times = analyze_audio("test_songs/"+file)
-            spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr).mean()
-            self.track_features[file] = {}
-            self.track_features[file]['tempo'] = int(tempo)
-            self.track_features[file]['key'] = int(key)
-            self.track_features[file]['energy'] = float(spectral_centroid)
-
-        # Create feature matrix for NN
-        features = np.array([
-            [f['tempo'], f['key'], f['energy']]
+    def _build_index(self, refit_scaler=True):
+        self.names = np.array(list(self.track_features.keys()), dtype=str)
+        self.features = np.ascontiguousarray([
+            [f[k] for k in FEATURE_KEYS]
             for f in self.track_features.values()
-        ])
+        ], dtype=np.float64)
+        self.name_index = {name: i for i, name in enumerate(self.names)}
+
+        if refit_scaler:
+            self.scaled_features = self.scaler.fit_transform(self.features)
+        else:
+            self.scaled_features = self.scaler.transform(self.features)
+        self.nn_model = NearestNeighbors(algorithm="kd_tree")
+        self.nn_model.fit(self.scaled_features)
 
-        scaled_features = self.scaler.fit_transform(features)
+    def build_music_graph(self):
+        # Only new or changed songs are analyzed; the rest come from the index
+        index = LibraryIndex("test_songs")
+        index.refresh()
+        self.track_features = index.track_features()
+        self._build_index()
 
-        self.nn_model.fit(scaled_features)
+    def recommend_batch(self, seed_tracks, k=None):
+        """
+        Up to k nearest tracks for each seed, in one vectorized query.
+        Returns {seed: [names, nearest first]}; unknown seeds are skipped.
+        """
+        k = k or self.n_neighbors
+        seeds = [seed for seed in seed_tracks if seed in self.name_index]
+        if not seeds:
+            return {}
+        rows = [self.name_index[seed] for seed in seeds]
+        n_query = min(k + 1, len(self.names))
+        _, indices = self.nn_model.kneighbors(self.scaled_features[rows], n_neighbors=n_query)
 
-    def recommend_next_track(self):
-        current_track = random.choice(os.listdir("test_songs"))
-        current_features = self.track_features[current_track]
-        query = np.array([
-            current_features['tempo'],
-            current_features['key'],
-            current_features['energy']
-        ]).reshape(1, -1)
+        recommendations = {}
+        for seed, row, neighbors in zip(seeds, rows, indices):
+            neighbors = neighbors[neighbors != row][:k]
+            recommendations[seed] = self.names[neighbors].tolist()
+        return recommendations
 
-        scaled_query = self.scaler.transform(query)
+    def order_set(self, tracks=None, start_track=None):
+        """
+        Play order for a pool of library tracks (default: the whole library)
+        that keeps tempo jumps, Camelot clashes and energy swings low.
+        Returns (ordered names, total transition cost); unknown names are skipped.
+        """
+        names = [t for t in (tracks if tracks is not None else self.names) if t in self.name_index]
+        rows = [self.name_index[name] for name in names]
+        pool = self.features[rows]
+        start = names.index(start_track) if start_track in names else None
+        order, cost = order_tracks(pool[:, 0], pool[:, 1], pool[:, 2], start=start)
+        return [str(names[i]) for i in order], cost
 
-        distances, indices = self.nn_model.kneighbors(scaled_query)
-        similar_indices = indices[0][1:]
-        recommended_index = random.choice(similar_indices)
-        recommended_track = list(self.track_features.keys())[recommended_index]
+    def recommend_next_track(self, k=None):
+        current_track = str(random.choice(self.names))
+        similar_tracks = self.recommend_batch([current_track], k)[current_track]
+        recommended_track = random.choice(similar_tracks) if similar_tracks else current_track
         return current_track, recommended_track
     
     def save_model(self):
@@ -63,10 +98,7 @@ class AIDJ:
         # Save the model
         data = joblib.load('dj_model_data.pkl')
         self.track_features = data['track_features']
-        self.nn_model = data['nn_model']
         self.scaler = data['scaler']
-
-    
-    
-
-
+        # Rebuilt rather than unpickled so older brute-force models get the
+        # k-d tree and name arrays too
+        self._build_index(refit_scaler=False)
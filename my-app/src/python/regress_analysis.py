@@ -0,0 +1,116 @@
+"""
+Regression harness for the analysis sample rate: extracts features for
+every track in a directory at the track's own rate and at a reduced rate
+(ANALYSIS_SR if set, else CANDIDATE_SR), then compares tempo, key, beats
+and sections per track and the planned transition for each pair of
+neighbouring tracks. Reports the speedup and peak analysis memory, and
+exits non-zero if any result moved materially.
+
+    python regress_analysis.py [directory] [analysis_sr]
+
+analysis_sr 0 means each track's own rate, as for ANALYSIS_SR.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from decode import decode_audio
+from features import ANALYSIS_SR, extract_features
+from library_index import AUDIO_EXTENSIONS
+from pipeline import plan_transition
+
+TEMPO_TOLERANCE = 1.0    # BPM
+BEAT_TOLERANCE = 0.05    # s; beats further than this from any full-rate beat count as moved
+MIN_BEAT_MATCH = 0.9     # share of beats that must stay put
+SECTION_TOLERANCE = 1.0  # s, per section boundary
+CANDIDATE_SR = 22050     # compared when ANALYSIS_SR is left at the native rate
+PLAN_TOLERANCE = 0.5     # s, for the transition point and song 2 entry
+
+def analyze_at(track, sr):
+    """(TrackAnalysis, seconds, peak bytes) for one track at one rate, bypassing the cache."""
+    y = track.mono(sr)
+    tracemalloc.start()
+    start = time.perf_counter()
+    analysis = extract_features(y, sr)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return analysis, elapsed, peak
+
+def beat_match(reference, beats):
+    """Share of reference beats with a beat within BEAT_TOLERANCE."""
+    if len(reference) == 0 or len(beats) == 0:
+        return float(len(reference) == len(beats))
+    right = np.clip(np.searchsorted(beats, reference), 0, len(beats) - 1)
+    left = np.maximum(right - 1, 0)
+    distance = np.minimum(np.abs(reference - beats[left]), np.abs(reference - beats[right]))
+    return float(np.mean(distance <= BEAT_TOLERANCE))
+
+def plan(a1, a2, duration1, duration2):
+    # No lyrics, so plans depend on the audio features alone
+    return plan_transition(a1.tempo, a1.beats, a1.energy, a1.energy_times, [], duration1,
+                           a2.tempo, a2.beats, [], duration2, sections1=a1.sections)
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else "test_songs"
+    analysis_sr = int(sys.argv[2]) if len(sys.argv) > 2 else (ANALYSIS_SR or CANDIDATE_SR)
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(AUDIO_EXTENSIONS))
+    if not names:
+        sys.exit(f"No audio files in {directory}")
+
+    failures = []
+    results = []
+    total_full = total_reduced = 0.0
+    print(f"{'track':40s} {'tempo':>13s} {'key':>7s} {'beats':>6s} {'sections':>9s} {'time':>15s} {'peak MB':>13s}")
+    for name in names:
+        track = decode_audio(os.path.join(directory, name))
+        full, full_time, full_peak = analyze_at(track, track.sr)
+        reduced, reduced_time, reduced_peak = analyze_at(track, min(analysis_sr or track.sr, track.sr))
+        total_full += full_time
+        total_reduced += reduced_time
+        results.append((track.duration, full, reduced))
+
+        matched = beat_match(full.beats, reduced.beats)
+        same_sections = len(full.sections) == len(reduced.sections)
+        section_shift = (np.max(np.abs(full.sections - reduced.sections))
+                         if same_sections and len(full.sections) else 0.0)
+        print(f"{name[:40]:40s} {full.tempo:6.1f}/{reduced.tempo:6.1f} {full.key:3d}/{reduced.key:3d} "
+              f"{matched:6.0%} {section_shift:8.2f}s {full_time:6.2f}s/{reduced_time:6.2f}s "
+              f"{full_peak / 2**20:6.0f}/{reduced_peak / 2**20:6.0f}")
+
+        if abs(full.tempo - reduced.tempo) > TEMPO_TOLERANCE:
+            failures.append(f"{name}: tempo {full.tempo:.1f} -> {reduced.tempo:.1f}")
+        if full.key != reduced.key:
+            failures.append(f"{name}: key {full.key} -> {reduced.key}")
+        if matched < MIN_BEAT_MATCH:
+            failures.append(f"{name}: only {matched:.0%} of beats unchanged")
+        if not same_sections:
+            failures.append(f"{name}: {len(full.sections)} sections -> {len(reduced.sections)}")
+        elif section_shift > SECTION_TOLERANCE:
+            failures.append(f"{name}: a section boundary moved by {section_shift:.2f}s")
+
+    print()
+    for (name1, name2), (r1, r2) in zip(zip(names, names[1:]), zip(results, results[1:])):
+        plan_full = plan(r1[1], r2[1], r1[0], r2[0])
+        plan_reduced = plan(r1[2], r2[2], r1[0], r2[0])
+        shift = max(abs(plan_full["transition_point"] - plan_reduced["transition_point"]),
+                    abs(plan_full["song2_beat"] - plan_reduced["song2_beat"]))
+        print(f"{name1[:30]} -> {name2[:30]}: transition {plan_full['transition_point']:.2f}s/"
+              f"{plan_reduced['transition_point']:.2f}s, entry {plan_full['song2_beat']:.2f}s/"
+              f"{plan_reduced['song2_beat']:.2f}s")
+        if shift > PLAN_TOLERANCE:
+            failures.append(f"{name1} -> {name2}: plan moved by {shift:.2f}s")
+
+    reduced_rate = f"{analysis_sr} Hz" if analysis_sr else "native rate"
+    print(f"\nAnalysis time: {total_full:.2f}s at full rate, {total_reduced:.2f}s at {reduced_rate} "
+          f"(x{total_full / total_reduced:.1f})")
+    if failures:
+        print("\nMaterial changes:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("No material changes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Camelot wheel number for each key index, same wheel as audiomix.to_camelot
+CAMELOT_NUMBERS = np.array([8, 3, 10, 5, 12, 7, 2, 9, 4, 11, 6, 1])
+
+DEFAULT_WEIGHTS = {"tempo": 1.0, "key": 1.0, "energy": 0.5}
+MAX_STRETCH = 0.15  # get_stretch_rate clamps rates to 0.85-1.15
+
+def transition_costs(tempo, key, energy, weights=DEFAULT_WEIGHTS):
+    """
+    Symmetric (n, n) matrix of how rough a transition between each pair of
+    tracks would be, built with broadcasting rather than per-pair loops.
+    - tempo: relative BPM gap, with a steep penalty past the stretch clamp
+    - key: steps apart on the Camelot wheel (0 or 1 mixes harmonically)
+    - energy: spectral-centroid jump in standard deviations
+    """
+    tempo = np.maximum(np.asarray(tempo, dtype=np.float64), 1.0)
+    energy = np.asarray(energy, dtype=np.float64)
+    camelot = CAMELOT_NUMBERS[np.asarray(key, dtype=np.int64) % 12]
+
+    ratio = np.abs(np.log(tempo[:, np.newaxis] / tempo[np.newaxis, :]))
+    tempo_cost = ratio / MAX_STRETCH
+    tempo_cost += 4.0 * np.maximum(0.0, tempo_cost - 1.0)
+
+    steps = np.abs(camelot[:, np.newaxis] - camelot[np.newaxis, :])
+    steps = np.minimum(steps, 12 - steps)
+    key_cost = np.maximum(0, steps - 1) / 2.0
+
+    spread = energy.std() or 1.0
+    energy_cost = np.abs(energy[:, np.newaxis] - energy[np.newaxis, :]) / spread
+
+    costs = weights["tempo"] * tempo_cost + weights["key"] * key_cost + weights["energy"] * energy_cost
+    np.fill_diagonal(costs, np.inf)
+    return costs
+
+def path_cost(costs, order):
+    order = np.asarray(order)
+    return float(costs[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+def _nearest_neighbor_path(costs, start):
+    n = len(costs)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    order[0] = start
+    visited[start] = True
+    for step in range(1, n):
+        row = np.where(visited, np.inf, costs[order[step - 1]])
+        order[step] = np.argmin(row)
+        visited[order[step]] = True
+    return order
+
+def _two_opt(costs, order, max_passes=50, fixed_start=False):
+    """
+    Open-path 2-opt: reverse order[i:k+1] whenever that shortens the path.
+    For each i, the gain of every k is computed in one vectorized step.
+    """
+    n = len(order)
+    finite = np.where(np.isfinite(costs), costs, 0.0)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1 if fixed_start else 0, n - 1):
+            ks = np.arange(i + 1, n)
+            a = order[i - 1] if i > 0 else -1
+            first = order[i]
+            last = order[ks]
+            after = np.where(ks + 1 < n, order[np.minimum(ks + 1, n - 1)], -1)
+
+            # Edges removed: (a, first) and (last, after); added: (a, last) and (first, after)
+            removed = (finite[a, first] if a >= 0 else 0.0) + np.where(after >= 0, finite[last, after], 0.0)
+            added = (finite[a, last] if a >= 0 else 0.0) + np.where(after >= 0, finite[first, after], 0.0)
+            gain = removed - added
+            best = np.argmax(gain)
+            if gain[best] > 1e-9:
+                k = ks[best]
+                order[i:k + 1] = order[i:k + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+def order_tracks(tempo, key, energy, weights=DEFAULT_WEIGHTS, n_starts=8, start=None):
+    """
+    Near-optimal play order for a pool of tracks: the best nearest-neighbor
+    tour from a few start tracks (or the given one), refined with 2-opt.
+    Returns (order as row indices, total transition cost).
+    """
+    n = len(tempo)
+    if n < 2:
+        return list(range(n)), 0.0
+    costs = transition_costs(tempo, key, energy, weights)
+
+    if start is not None:
+        starts = [start]
+    else:
+        # Tracks with the cheapest best-transition make good openers
+        starts = np.argsort(costs.min(axis=1))[:min(n, n_starts)]
+
+    # Greedy tours are cheap, so try several; only the best gets 2-opt
+    tours = [_nearest_neighbor_path(costs, s) for s in starts]
+    order = min(tours, key=lambda tour: path_cost(costs, tour))
+    order = _two_opt(costs, order, fixed_start=start is not None)
+    return order.tolist(), path_cost(costs, order)
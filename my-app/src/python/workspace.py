@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import logging
+logging.basicConfig(level=logging.INFO)
+
+WORKSPACE_ROOT = "workspaces"
+WORKSPACE_TTL = int(os.getenv("WORKSPACE_TTL", 60 * 60))  # seconds since last use
+# Uploads plus the decoded float32 PCM kept for re-renders (~21 MB per stereo
+# minute of each song) and, while it is encoded, the mix's own PCM
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", 512 * 1024 * 1024))
+WORKSPACE_MAX_MEMORY_BYTES = int(os.getenv("WORKSPACE_MAX_MEMORY_BYTES", 1024 * 1024 * 1024))
+
+class WorkspaceBudgetError(Exception):
+    pass
+
+class Workspace:
+    """
+    A directory holding one mix session's uploads, output and result, so
+    concurrent mixes never share a path. Workspaces not used for
+    WORKSPACE_TTL seconds are removed by cleanup_expired().
+    """
+    RESULT_FILE = "result.json"
+
+    def __init__(self, workspace_id, root=WORKSPACE_ROOT, max_bytes=WORKSPACE_MAX_BYTES,
+                 max_memory_bytes=WORKSPACE_MAX_MEMORY_BYTES):
+        self.id = workspace_id
+        self.path = os.path.join(root, workspace_id)
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+
+    @classmethod
+    def create(cls, root=WORKSPACE_ROOT):
+        cleanup_expired(root)
+        workspace = cls(uuid.uuid4().hex, root)
+        os.makedirs(workspace.path)
+        return workspace
+
+    @classmethod
+    def open(cls, workspace_id, root=WORKSPACE_ROOT):
+        """Returns the workspace, or None if the id is unknown or malformed."""
+        if not workspace_id or not all(c in "0123456789abcdef" for c in workspace_id):
+            return None
+        workspace = cls(workspace_id, root)
+        if not os.path.isdir(workspace.path):
+            return None
+        workspace.touch()
+        return workspace
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def touch(self):
+        os.utime(self.path)
+
+    def disk_usage(self):
+        total = 0
+        for name in os.listdir(self.path):
+            try:
+                total += os.path.getsize(self.file(name))
+            except FileNotFoundError:
+                pass
+        return total
+
+    def check_disk_budget(self):
+        usage = self.disk_usage()
+        if usage > self.max_bytes:
+            raise WorkspaceBudgetError(f"Workspace uses {usage} bytes (limit {self.max_bytes})")
+
+    def check_memory_budget(self, *tracks):
+        # Decoded inputs, the stretched copy and the mixed output together
+        # come to roughly three times the decoded size
+        estimate = 3 * sum(track.samples.nbytes for track in tracks)
+        if estimate > self.max_memory_bytes:
+            raise WorkspaceBudgetError(f"Mix needs ~{estimate} bytes of memory (limit {self.max_memory_bytes})")
+
+    def save_upload(self, storage, name):
+        path = self.file(name)
+        storage.save(path)
+        try:
+            self.check_disk_budget()
+        except WorkspaceBudgetError:
+            os.remove(path)
+            raise
+        return path
+
+    def save_json(self, name, data):
+        # Unique temp name: concurrent requests on one session may both save
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.file(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_json(self, name):
+        try:
+            with open(self.file(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_result(self, result):
+        self.save_json(self.RESULT_FILE, result)
+
+    def load_result(self):
+        return self.load_json(self.RESULT_FILE)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def cleanup_expired(root=WORKSPACE_ROOT, ttl=WORKSPACE_TTL):
+    os.makedirs(root, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                logging.info(f"Removed expired workspace {name}")
+        except FileNotFoundError:
+            pass